@@ -1,7 +1,19 @@
 import cv2
 import numpy as np
 import math
+import abc
 import os
+import glob
+import argparse
+import cProfile
+import csv
+import itertools
+import multiprocessing
+import copy
+try:
+    import tomllib  # Python 3.11+, only needed for TOML config files
+except ImportError:
+    tomllib = None
 import tkinter as tk
 from tkinter import ttk, filedialog, simpledialog
 from PIL import Image, ImageTk
@@ -13,6 +25,18 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
 import re  # For email validation
+import base64
+import hashlib
+import struct
+import json
+import queue
+import sqlite3
+import tarfile
+import zipfile
+import socket
+import urllib.request
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Load pre-trained models
 try:
@@ -31,41 +55,2546 @@ except Exception as e:
 SAVE_DIRECTORY = "captured_images"
 os.makedirs(SAVE_DIRECTORY, exist_ok=True)
 
+# Cascade parameters
+FACE_DETECTION_PARAMS = {
+    "scaleFactor": 1.1,
+    "minNeighbors": 4,      # Reduced for better detection
+    "minSize": (20, 20),    # Smaller minimum size to detect faces from a distance
+}
+SMILE_DETECTION_PARAMS = {
+    "scaleFactor": 1.3,
+    "minNeighbors": 10,
+    "minSize": (15, 15),
+}
+
+def set_detection_params(face, smile):
+    """Swap in new cascade parameters; detection picks them up on the next frame"""
+    global FACE_DETECTION_PARAMS, SMILE_DETECTION_PARAMS
+    face, smile = dict(face), dict(smile)
+    for params in (face, smile):
+        if "minSize" in params:
+            params["minSize"] = tuple(params["minSize"])
+    FACE_DETECTION_PARAMS, SMILE_DETECTION_PARAMS = face, smile
+
+# Motion gate settings - detection only runs when the scene changes
+MOTION_SAMPLE_WIDTH = 64        # Width of the downscaled grayscale sample
+MOTION_PIXEL_THRESHOLD = 25     # Per-pixel difference that counts as a change
+MOTION_AREA_THRESHOLD = 0.01    # Fraction of changed pixels that counts as motion
+MOTION_REFRESH_INTERVAL = 10.0  # Force a detection pass this often (seconds)
+MOTION_IDLE_AFTER = 30.0        # Seconds without motion before polling slows down
+MOTION_IDLE_INTERVAL = 0.5      # Seconds between frames while idle
+
+class MotionGate:
+    """Cheap frame-difference gate that decides when full detection is needed"""
+    def __init__(self, sample_width=MOTION_SAMPLE_WIDTH, pixel_threshold=MOTION_PIXEL_THRESHOLD,
+                 area_threshold=MOTION_AREA_THRESHOLD, refresh_interval=MOTION_REFRESH_INTERVAL,
+                 idle_after=MOTION_IDLE_AFTER, idle_interval=MOTION_IDLE_INTERVAL):
+        self.sample_width = sample_width
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.refresh_interval = refresh_interval
+        self.idle_after = idle_after
+        self.idle_interval = idle_interval
+        
+        # Sample taken at the last detection pass, used as the reference
+        self.reference = None
+        self.last_detection_time = 0
+        self.last_motion_time = time.time()
+        
+        # Statistics
+        self.frames_total = 0
+        self.frames_skipped = 0
+    
+    def sample(self, frame):
+        """Build a tiny blurred grayscale version of the frame"""
+        height, width = frame.shape[:2]
+        sample_height = max(1, int(height * self.sample_width / width))
+        # Downscale first so the color conversion and blur work on very few pixels
+        small = cv2.resize(frame, (self.sample_width, sample_height), interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+    
+    def should_detect(self, frame, now=None):
+        """Return True when the frame differs enough from the last detected one"""
+        if now is None:
+            now = time.time()
+        small = self.sample(frame)
+        self.frames_total += 1
+        
+        if self.reference is None or self.reference.shape != small.shape:
+            motion = True
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            _, changed = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            motion = cv2.countNonZero(changed) > self.area_threshold * changed.size
+        
+        if motion:
+            self.last_motion_time = now
+        elif now - self.last_detection_time < self.refresh_interval:
+            # Static scene - reuse the last detection result
+            self.frames_skipped += 1
+            return False
+        
+        # Compare later frames against this one so slow drift still adds up
+        self.reference = small
+        self.last_detection_time = now
+        return True
+    
+    @property
+    def is_idle(self):
+        """True when nothing has moved for longer than idle_after"""
+        return time.time() - self.last_motion_time > self.idle_after
+    
+    @property
+    def skipped_percent(self):
+        """Percentage of frames for which detection was skipped"""
+        if self.frames_total == 0:
+            return 0.0
+        return 100.0 * self.frames_skipped / self.frames_total
+
+# Frame-rate governor settings - keeps processing within a latency and CPU budget
+CAMERA_WIDTH = 640               # Requested camera resolution
+CAMERA_HEIGHT = 480
+GOVERNOR_TARGET_LATENCY = 0.05   # Processing time per frame (seconds)
+GOVERNOR_CPU_TARGET = 60.0       # Process CPU load (percent of one core)
+GOVERNOR_ADJUST_PERIOD = 1.0     # Seconds between adjustments
+
+class FrameRateGovernor:
+    """Adjusts detection interval, detection scale and frame rate to a latency/CPU target"""
+    DETECTION_SCALES = (1.0, 0.75, 0.5)
+    FRAME_RATES = (30, 20, 15, 10, 5)
+    MAX_DETECT_INTERVAL = 6
+    
+    def __init__(self, target_latency=GOVERNOR_TARGET_LATENCY, cpu_target=GOVERNOR_CPU_TARGET,
+                 adjust_period=GOVERNOR_ADJUST_PERIOD, camera_size=(CAMERA_WIDTH, CAMERA_HEIGHT)):
+        self.target_latency = target_latency
+        self.cpu_target = cpu_target
+        self.adjust_period = adjust_period
+        self.camera_size = camera_size
+        
+        # Current settings - start at full quality and back off under load
+        self.detect_interval = 1
+        self.scale_index = 0
+        self.rate_index = 0
+        
+        # Measurements for the current adjustment period
+        self.frame_times = []
+        self.frame_count = 0
+        self.last_adjust_time = time.time()
+        self.last_cpu_time = time.process_time()
+        self.last_tick_time = 0
+        self.avg_latency = 0.0
+        self.cpu_percent = 0.0
+        
+        # Camera settings last pushed through cap.set
+        self.camera = None
+        self.camera_fps = None
+        self.camera_resolution = None
+        # Size of the frames the camera delivers at full quality, which may differ from camera_size
+        self.full_size = None
+        
+        # Disabled for replays, which are paced by the source and must be deterministic
+        self.enabled = True
+    
+    @property
+    def detect_scale(self):
+        """Scale factor applied to the frame before face detection"""
+        return self.DETECTION_SCALES[self.scale_index]
+    
+    @property
+    def frame_rate(self):
+        """Target frame rate for capture and preview"""
+        return self.FRAME_RATES[self.rate_index]
+    
+    @property
+    def resolution(self):
+        """Capture resolution - lowered together with the detection scale"""
+        width, height = self.full_size or self.camera_size
+        return (int(width * self.detect_scale) // 2 * 2, int(height * self.detect_scale) // 2 * 2)
+    
+    def scale_for(self, frame_size):
+        """Detection scale for a (width, height) frame, taking into account whether the camera lowered its resolution"""
+        if not self.enabled:
+            return 1.0
+        if self.scale_index == 0 or self.full_size is None:
+            # Full quality - remember what the camera actually delivers
+            self.full_size = frame_size
+            return self.detect_scale
+        return min(1.0, self.detect_scale * self.full_size[0] / frame_size[0])
+    
+    def should_detect(self):
+        """Return True when detection is due on this frame"""
+        if not self.enabled:
+            return True
+        self.frame_count += 1
+        return self.frame_count % self.detect_interval == 0
+    
+    def record(self, processing_time):
+        """Record the processing time of one frame and adjust settings periodically"""
+        if not self.enabled:
+            return
+        self.frame_times.append(processing_time)
+        
+        now = time.time()
+        elapsed = now - self.last_adjust_time
+        if elapsed < self.adjust_period:
+            return
+        
+        # Average latency and CPU load over the period
+        cpu_time = time.process_time()
+        self.cpu_percent = 100.0 * (cpu_time - self.last_cpu_time) / elapsed
+        self.avg_latency = sum(self.frame_times) / len(self.frame_times)
+        self.last_cpu_time = cpu_time
+        self.last_adjust_time = now
+        self.frame_times = []
+        
+        if self.avg_latency > self.target_latency or self.cpu_percent > self.cpu_target:
+            self.degrade()
+        elif self.avg_latency < 0.6 * self.target_latency and self.cpu_percent < 0.6 * self.cpu_target:
+            # Only step back up with plenty of headroom to avoid oscillating
+            self.upgrade()
+    
+    def degrade(self):
+        """Reduce the amount of work - detection interval first, then scale, then frame rate"""
+        if self.detect_interval < self.MAX_DETECT_INTERVAL:
+            self.detect_interval += 1
+        elif self.scale_index < len(self.DETECTION_SCALES) - 1:
+            self.scale_index += 1
+        elif self.rate_index < len(self.FRAME_RATES) - 1:
+            self.rate_index += 1
+    
+    def upgrade(self):
+        """Restore quality in the reverse order of degrade"""
+        if self.rate_index > 0:
+            self.rate_index -= 1
+        elif self.scale_index > 0:
+            self.scale_index -= 1
+        elif self.detect_interval > 1:
+            self.detect_interval -= 1
+    
+    def apply_to_camera(self, cap):
+        """Push resolution and frame rate to the camera when they change"""
+        if cap is not self.camera:
+            self.camera = cap
+            self.camera_fps = None
+            self.camera_resolution = None
+        
+        # Cameras that can't change resolution keep delivering full frames; scale_for covers both
+        if self.camera_resolution != self.resolution:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+            self.camera_resolution = self.resolution
+        
+        if self.camera_fps != self.frame_rate:
+            cap.set(cv2.CAP_PROP_FPS, self.frame_rate)
+            self.camera_fps = self.frame_rate
+    
+    def wait_for_next_frame(self):
+        """Sleep for the rest of the frame interval"""
+        if not self.enabled:
+            return
+        interval = 1.0 / self.frame_rate
+        remaining = self.last_tick_time + interval - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.last_tick_time = time.time()
+
+# Capture sources - device indices, video files or RTSP/HTTP URLs
+CAMERA_SOURCES = [0]
+CAMERA_STAND_INS = {}            # Local file or device used while a remote source is down
+CAMERA_CONNECT_TIMEOUT = 3.0     # Seconds to wait for the first frame at startup
+RECONNECT_MIN_DELAY = 0.5        # Reconnect backoff range (seconds)
+RECONNECT_MAX_DELAY = 30.0
+READ_TIMEOUT = 1.0               # Seconds read() waits for a new frame
+MAX_READ_ERRORS = 3              # Consecutive read failures before reconnecting
+
+class CaptureSource:
+    """A camera, video file or stream read on its own thread with automatic reconnect"""
+    def __init__(self, source, stand_in=None, min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.source = source
+        self.stand_in = stand_in
+        self.name = f"Camera {source}" if isinstance(source, int) else str(source)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        
+        # The VideoCapture is only touched by the reader thread
+        self.capture = None
+        self.using_stand_in = False
+        self.properties = {}          # cap.set values, re-applied after every reconnect
+        self.pending_properties = {}
+        self.properties_lock = threading.Lock()
+        
+        # Latest frame handed over to read()
+        self.frame_ready = threading.Condition()
+        self.frame = None
+        self.frame_time = 0
+        self.frame_id = 0
+        self.read_id = 0
+        self.timestamp = 0          # Grab time of the frame last returned by read()
+        
+        self.running = False
+        self.stop_event = threading.Event()
+        self.connected = threading.Event()
+        self.thread = None
+        
+        # Health statistics
+        self.state = "connecting"
+        self.frames = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.fps = 0.0
+        self.last_frame_time = 0
+        self.last_primary_attempt = 0
+    
+    def start(self):
+        """Start the reader thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def _open(self, source):
+        """Open a VideoCapture, returning None if it is not available"""
+        try:
+            capture = cv2.VideoCapture(source)
+        except Exception as e:
+            print(f"Error opening {source}: {e}")
+            return None
+        if not capture.isOpened():
+            capture.release()
+            return None
+        return capture
+    
+    def _connect(self):
+        """Connect to the source, falling back to the stand-in"""
+        capture = self._open(self.source)
+        self.using_stand_in = False
+        if capture is None and self.stand_in is not None:
+            capture = self._open(self.stand_in)
+            self.using_stand_in = capture is not None
+        self.last_primary_attempt = time.time()
+        if capture is None:
+            return False
+        
+        self._apply_properties(capture)
+        self.capture = capture
+        self.state = "stand-in" if self.using_stand_in else "live"
+        return True
+    
+    def _apply_properties(self, capture):
+        """Re-apply every property set so far to a new connection"""
+        with self.properties_lock:
+            properties = dict(self.properties)
+        for prop, value in properties.items():
+            capture.set(prop, value)
+    
+    def _disconnect(self):
+        """Release the current VideoCapture"""
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            try:
+                capture.release()
+            except Exception as e:
+                print(f"Error releasing {self.name}: {e}")
+    
+    def _is_file(self, source):
+        """Video files are paced at their own frame rate like a live feed"""
+        return isinstance(source, str) and "://" not in source
+    
+    def _run(self):
+        delay = self.min_delay
+        error_count = 0
+        
+        while self.running:
+            try:
+                # (Re)connect with exponential backoff
+                if self.capture is None:
+                    if not self._connect():
+                        self.state = "reconnecting"
+                        self.stop_event.wait(delay)
+                        delay = min(delay * 2, self.max_delay)
+                        continue
+                    delay = self.min_delay
+                    error_count = 0
+                
+                # Go back to the real source once it is reachable again
+                if self.using_stand_in and time.time() - self.last_primary_attempt > self.max_delay:
+                    self.last_primary_attempt = time.time()
+                    capture = self._open(self.source)
+                    if capture is not None:
+                        self._disconnect()
+                        self._apply_properties(capture)
+                        self.capture = capture
+                        self.using_stand_in = False
+                        self.state = "live"
+                
+                # Apply cap.set calls made from other threads
+                if self.pending_properties:
+                    with self.properties_lock:
+                        pending, self.pending_properties = self.pending_properties, {}
+                    for prop, value in pending.items():
+                        self.capture.set(prop, value)
+                
+                read_start = time.time()
+                ret, frame = self.capture.read()
+                if not ret:
+                    self.errors += 1
+                    error_count += 1
+                    if error_count >= MAX_READ_ERRORS:
+                        # Treat repeated failures as a disconnect
+                        self._disconnect()
+                        self.reconnects += 1
+                        self.state = "reconnecting"
+                    else:
+                        self.stop_event.wait(0.05)
+                    continue
+                error_count = 0
+                
+                # Hand the frame over to read()
+                with self.frame_ready:
+                    self.frame = frame
+                    self.frame_time = time.time()
+                    self.frame_id += 1
+                    self.frame_ready.notify_all()
+                self.connected.set()
+                
+                # Update statistics
+                now = time.time()
+                if self.last_frame_time:
+                    instant_fps = 1.0 / max(now - self.last_frame_time, 1e-6)
+                    self.fps = 0.9 * self.fps + 0.1 * instant_fps if self.fps else instant_fps
+                self.last_frame_time = now
+                self.frames += 1
+                
+                # Don't read video files faster than they were recorded
+                current = self.stand_in if self.using_stand_in else self.source
+                if self._is_file(current):
+                    file_fps = self.capture.get(cv2.CAP_PROP_FPS) or 30
+                    self.stop_event.wait(max(0, 1.0 / file_fps - (now - read_start)))
+            
+            except Exception as e:
+                # A broken stream can make OpenCV raise - drop the connection and reconnect with backoff
+                print(f"Error reading {self.name}: {e}")
+                self.errors += 1
+                self._disconnect()
+                self.reconnects += 1
+                self.state = "reconnecting"
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, self.max_delay)
+        
+        self._disconnect()
+        self.state = "stopped"
+    
+    def wait_until_connected(self, timeout):
+        """Wait for the first frame; returns True if the source is delivering frames"""
+        return self.connected.wait(timeout)
+    
+    def read(self, timeout=READ_TIMEOUT):
+        """Return the next frame like cv2.VideoCapture.read, without blocking other sources"""
+        with self.frame_ready:
+            if self.frame_id == self.read_id:
+                self.frame_ready.wait(timeout)
+            if self.frame_id == self.read_id:
+                return False, None
+            self.read_id = self.frame_id
+            self.timestamp = self.frame_time
+            return True, self.frame
+    
+    def isOpened(self):
+        """True until the source is released, even while reconnecting"""
+        return self.running
+    
+    def set(self, prop, value):
+        """Queue a capture property; it is kept across reconnects"""
+        with self.properties_lock:
+            self.properties[prop] = value
+            self.pending_properties[prop] = value
+        return True
+    
+    def get(self, prop):
+        """Read a capture property from the current connection"""
+        capture = self.capture
+        return capture.get(prop) if capture is not None else 0
+    
+    def release(self, timeout=2.0):
+        """Stop the reader thread and release the device; returns False if it is still running"""
+        self.running = False
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
+    
+    def stats(self):
+        """Health and frame-rate statistics for this source"""
+        age = time.time() - self.last_frame_time if self.last_frame_time else None
+        return {
+            "name": self.name,
+            "state": self.state,
+            "fps": self.fps if age is not None and age < 2.0 else 0.0,
+            "frames": self.frames,
+            "errors": self.errors,
+            "reconnects": self.reconnects,
+            "last_frame_age": age,
+        }
+
+class CaptureManager:
+    """Owns several capture sources so a failing source never stalls the others"""
+    def __init__(self, sources, stand_ins=None):
+        self.stand_ins = stand_ins or {}
+        self.sources = {}
+        for source in sources:
+            self.add_source(source)
+    
+    def add_source(self, source, stand_in=None):
+        """Add and start a source; it keeps retrying until the device appears"""
+        if stand_in is None:
+            stand_in = self.stand_ins.get(source)
+        capture = CaptureSource(source, stand_in)
+        capture.start()
+        self.sources[capture.name] = capture
+        return capture
+    
+    def remove_source(self, name):
+        """Stop and forget a source"""
+        capture = self.sources.pop(name, None)
+        if capture is not None:
+            capture.release()
+    
+    def get(self, name):
+        return self.sources.get(name)
+    
+    @property
+    def primary(self):
+        """The first configured source"""
+        return next(iter(self.sources.values()), None)
+    
+    def stats(self):
+        return [capture.stats() for capture in self.sources.values()]
+    
+    def release(self, timeout=2.0):
+        """Release every source within the timeout; returns False if any is still running"""
+        for capture in self.sources.values():
+            capture.running = False
+            capture.stop_event.set()
+        end = time.time() + timeout
+        stopped = True
+        for capture in self.sources.values():
+            stopped = capture.release(max(0.0, end - time.time())) and stopped
+        return stopped
+
+# Replay settings - recorded clips or image sequences instead of a live camera
+REPLAY_DEFAULT_FPS = 30.0        # Frame rate for image sequences without timestamps
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class ReplayCapture:
+    """Plays back a recorded clip or image sequence through the VideoCapture API"""
+    def __init__(self, path, realtime=True, loop=False, fps=REPLAY_DEFAULT_FPS):
+        self.path = path
+        self.name = f"Replay {os.path.basename(path.rstrip(os.sep))}"
+        self.realtime = realtime
+        self.loop = loop
+        self.fps = fps
+        
+        # Either a video file or a sorted list of image files
+        self.video = None
+        self.images = []
+        self.image_times = []
+        self.index = 0
+        self.frames_read = 0
+        self.frame_size = (0, 0)
+        self.opened = False
+        
+        # Position on the recording timeline (seconds) and wall clock reference
+        self.timestamp = 0.0
+        self.first_timestamp = None
+        self.loop_offset = 0.0
+        self.start_wall_time = None
+        
+        self.open()
+    
+    def open(self):
+        """Open the clip, image directory or glob pattern"""
+        if os.path.isdir(self.path) or any(c in self.path for c in "*?["):
+            pattern = os.path.join(self.path, "*") if os.path.isdir(self.path) else self.path
+            self.images = sorted(f for f in glob.glob(pattern) if f.lower().endswith(IMAGE_EXTENSIONS))
+            self.image_times = self.load_image_times()
+            self.opened = bool(self.images)
+        else:
+            self.video = cv2.VideoCapture(self.path)
+            self.opened = self.video.isOpened()
+            if self.opened:
+                self.fps = self.video.get(cv2.CAP_PROP_FPS) or self.fps
+        
+        if not self.opened:
+            print(f"Error: cannot open replay source {self.path}")
+    
+    def load_image_times(self):
+        """Original timestamps from timestamps.txt (milliseconds per line) or a fixed frame rate"""
+        folder = self.path if os.path.isdir(self.path) else os.path.dirname(self.path)
+        times_file = os.path.join(folder, "timestamps.txt")
+        if os.path.exists(times_file):
+            with open(times_file) as f:
+                times = [float(line) / 1000.0 for line in f if line.strip()]
+            if len(times) >= len(self.images):
+                return times[:len(self.images)]
+            print("Warning: timestamps.txt is shorter than the image sequence, using a fixed frame rate")
+        return [i / self.fps for i in range(len(self.images))]
+    
+    def next_frame(self):
+        """Return the next recorded (frame, timestamp), or (None, None) at the end"""
+        if self.video is not None:
+            ret, frame = self.video.read()
+            if not ret:
+                return None, None
+            return frame, self.video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        
+        while self.index < len(self.images):
+            path = self.images[self.index]
+            timestamp = self.image_times[self.index]
+            self.index += 1
+            frame = cv2.imread(path)
+            if frame is not None:
+                return frame, timestamp
+            print(f"Warning: skipping unreadable image {path}")
+        return None, None
+    
+    def rewind(self):
+        """Go back to the first frame"""
+        if self.video is not None:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.index = 0
+    
+    def read(self):
+        """Return the next frame, sleeping to honour the original timing in real-time mode"""
+        if not self.opened:
+            return False, None
+        
+        frame, timestamp = self.next_frame()
+        if frame is None and self.loop:
+            # Continue the timeline after the end of the recording
+            self.loop_offset = self.timestamp + 1.0 / self.fps
+            self.first_timestamp = None
+            self.rewind()
+            frame, timestamp = self.next_frame()
+        if frame is None:
+            self.opened = False
+            return False, None
+        
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.timestamp = self.loop_offset + timestamp - self.first_timestamp
+        self.frames_read += 1
+        self.frame_size = (frame.shape[1], frame.shape[0])
+        
+        if self.realtime:
+            if self.start_wall_time is None:
+                self.start_wall_time = time.time() - self.timestamp
+            delay = self.start_wall_time + self.timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        
+        return True, frame
+    
+    def wait_until_connected(self, timeout):
+        """Replays are ready as soon as they are opened"""
+        return self.opened
+    
+    def isOpened(self):
+        return self.opened
+    
+    def set(self, prop, value):
+        """Recorded clips can't change resolution or frame rate"""
+        return False
+    
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.timestamp * 1000.0
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frames_read
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_size[1]
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.video.get(prop) if self.video is not None else len(self.images)
+        return 0
+    
+    def release(self):
+        if self.video is not None:
+            self.video.release()
+        self.opened = False
+
+# Preview server settings - remote viewing of the annotated feed
+PREVIEW_SERVER_HOST = "127.0.0.1" # Local only - the feed has no authentication, use 0.0.0.0 to share it
+PREVIEW_SERVER_PORT = None       # Set a port (e.g. 8080) to enable the server
+PREVIEW_WIDTH = 640              # Width of the streamed frames
+PREVIEW_QUALITY = 70             # JPEG quality of the streamed frames
+PREVIEW_MAX_FPS = 10             # Upper limit on encoded frames per second
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+PREVIEW_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Smile Detection App - Live Preview</title></head>
+<body style="font-family: 'Segoe UI', Arial, sans-serif; background-color: #f5f5f7; text-align: center;">
+    <h2 style="color: #4a6cd4;">Smile Detection App - Live Preview</h2>
+    <img id="preview" src="/stream.mjpg" style="border: 2px solid #333333; max-width: 100%;">
+    <script>
+        // Open the page with #ws to receive frames over a WebSocket instead of MJPEG
+        if (location.hash === "#ws") {
+            const img = document.getElementById("preview");
+            const socket = new WebSocket("ws://" + location.host + "/ws");
+            socket.binaryType = "blob";
+            socket.onmessage = (event) => {
+                const old = img.src;
+                img.src = URL.createObjectURL(event.data);
+                if (old.startsWith("blob:")) URL.revokeObjectURL(old);
+            };
+        }
+    </script>
+</body>
+</html>
+"""
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """Serves the preview page, an MJPEG stream and a WebSocket stream"""
+    # Browsers only accept the WebSocket upgrade on HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        preview = self.server.preview
+        if self.path == "/":
+            body = PREVIEW_PAGE.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/stream.mjpg":
+            self.stream_mjpeg(preview)
+        elif self.path == "/ws" and self.headers.get("Upgrade", "").lower() == "websocket":
+            self.stream_websocket(preview)
+        else:
+            self.send_error(404)
+    
+    def stream_mjpeg(self, preview):
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        
+        def send(jpeg):
+            self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+            self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+            self.wfile.write(jpeg)
+            self.wfile.write(b"\r\n")
+        
+        preview.serve_client(send)
+    
+    def stream_websocket(self, preview):
+        # RFC 6455 handshake
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        
+        def send(jpeg):
+            # Unmasked binary frame with the shortest length encoding
+            length = len(jpeg)
+            if length < 126:
+                header = struct.pack("!BB", 0x82, length)
+            elif length < 65536:
+                header = struct.pack("!BBH", 0x82, 126, length)
+            else:
+                header = struct.pack("!BBQ", 0x82, 127, length)
+            self.wfile.write(header + jpeg)
+        
+        preview.serve_client(send)
+    
+    def log_message(self, format, *args):
+        # Keep the console quiet - one line per client is enough
+        pass
+
+class PreviewServer:
+    """Encodes the annotated frame once per tick and fans it out to every client"""
+    def __init__(self, port, host=PREVIEW_SERVER_HOST, width=PREVIEW_WIDTH, quality=PREVIEW_QUALITY,
+                 max_fps=PREVIEW_MAX_FPS):
+        self.width = width
+        self.quality = quality
+        self.max_fps = max_fps
+        
+        # Latest encoded frame, shared by all clients
+        self.frame_ready = threading.Condition()
+        self.jpeg = None
+        self.frame_id = 0
+        self.last_publish_time = 0
+        self.running = True
+        
+        # Statistics
+        self.clients = 0
+        self.frames_encoded = 0
+        self.frames_dropped = 0
+        
+        self.server = ThreadingHTTPServer((host, port), PreviewRequestHandler)
+        self.server.daemon_threads = True
+        self.server.preview = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Preview server running on http://{host}:{port}/")
+    
+    def publish(self, frame):
+        """Encode the frame for the clients, respecting the frame rate limit"""
+        # No viewers - don't spend any CPU on encoding
+        if self.clients == 0:
+            return
+        now = time.time()
+        if now - self.last_publish_time < 1.0 / self.max_fps:
+            return
+        self.last_publish_time = now
+        
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, int(height * self.width / width)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        
+        with self.frame_ready:
+            self.jpeg = encoded.tobytes()
+            self.frame_id += 1
+            self.frames_encoded += 1
+            self.frame_ready.notify_all()
+    
+    def serve_client(self, send):
+        """Send frames to one client until it disconnects; slow clients skip frames"""
+        with self.frame_ready:
+            self.clients += 1
+        last_id = 0
+        try:
+            while self.running:
+                with self.frame_ready:
+                    if self.frame_id == last_id:
+                        self.frame_ready.wait(1.0)
+                    if self.frame_id == last_id:
+                        continue
+                    # Always jump to the newest frame, dropping any the client missed
+                    if last_id:
+                        self.frames_dropped += self.frame_id - last_id - 1
+                    last_id = self.frame_id
+                    jpeg = self.jpeg
+                send(jpeg)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            with self.frame_ready:
+                self.clients -= 1
+    
+    def stop(self):
+        """Disconnect all clients and stop the server"""
+        self.running = False
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+# Memory budgets
+QUEUE_MAX_SIZE = 100             # Items held between pipeline stages before the oldest is dropped
+THUMBNAIL_CACHE_SIZE = 100       # Decoded gallery thumbnails kept in memory
+THUMBNAIL_SIZE = (200, 160)
+RETENTION_MAX_AGE_DAYS = None    # Delete captures older than this (None keeps them)
+RETENTION_MAX_TOTAL_MB = None    # Delete the oldest captures above this disk usage (None keeps them)
+RETENTION_CHECK_INTERVAL = 600   # Seconds between retention passes
+RETENTION_MIN_INTERVAL = 30      # Minimum seconds between passes woken up by captures
+CAPTURE_PREFIXES = ("face_", "clip_")  # Files in the save directory managed by the retention policy
+GALLERY_LOAD_BATCH = 50          # Gallery items added per event loop pass at startup
+GALLERY_MAX_ITEMS = 1000         # Newest captures kept in the gallery; older ones stay on disk and in search
+
+class BoundedQueue(queue.Queue):
+    """Queue that drops its oldest item instead of growing or blocking when full"""
+    def __init__(self, maxsize=QUEUE_MAX_SIZE):
+        super().__init__(maxsize)
+        self.dropped = 0
+    
+    def put(self, item, block=False, timeout=None):
+        while True:
+            try:
+                super().put(item, block=False)
+                return
+            except queue.Full:
+                try:
+                    self.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+class FrameBufferPool:
+    """Frame-sized buffers allocated once per resolution and reused through OpenCV dst= arguments
+    
+    The counters show whether steady-state processing still allocates or copies frames. Only the
+    video thread touches the buffers; the UI reads the counters and resident_bytes.
+    """
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+        self.copies = 0
+        self.resident_bytes = 0
+    
+    def get(self, name, shape, dtype=np.uint8):
+        """The buffer for a name, reallocated only when the shape changes"""
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            old_bytes = buffer.nbytes if buffer is not None else 0
+            buffer = np.empty(shape, dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+            # Kept as a running total so other threads never iterate the buffers
+            self.resident_bytes += buffer.nbytes - old_bytes
+        return buffer
+    
+    def copy(self, name, frame):
+        """Copy a frame into the named buffer"""
+        buffer = self.get(name, frame.shape, frame.dtype)
+        np.copyto(buffer, frame)
+        self.copies += 1
+        return buffer
+
+# Event notifier settings - compact capture events as an alternative to email
+NOTIFIER_WEBHOOK_URL = None      # HTTP endpoint that receives batches of events as a JSON array
+NOTIFIER_SOCKET_PATH = None      # Unix socket that receives one JSON event per line
+NOTIFIER_JSONL_PATH = None       # Append-only JSON Lines file, e.g. "captured_images/events.jsonl"
+NOTIFIER_BATCH_SIZE = 20         # Maximum events per write
+EVENT_THUMBNAIL_WIDTH = 96       # Width of the thumbnail embedded in each event
+EVENT_THUMBNAIL_QUALITY = 60
+
+def build_capture_event(capture_id, capture_time, detections, frame):
+    """Build the compact event sent to notifier sinks for one capture"""
+    boxes = []
+    smiling_faces = 0
+    for (x, y, w, h), smiles in detections:
+        smiling = len(smiles) > 0
+        smiling_faces += smiling
+        boxes.append([int(x), int(y), int(w), int(h), int(smiling)])
+    
+    # Small inline thumbnail so receivers don't need access to the image file
+    height, width = frame.shape[:2]
+    thumb_height = max(1, int(height * EVENT_THUMBNAIL_WIDTH / width))
+    thumb = cv2.resize(frame, (EVENT_THUMBNAIL_WIDTH, thumb_height), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, EVENT_THUMBNAIL_QUALITY])
+    
+    return {
+        "capture_id": capture_id,
+        "time": round(capture_time, 3),
+        "boxes": boxes,
+        "smile_score": round(smiling_faces / len(boxes), 3) if boxes else 0.0,
+        "thumbnail": base64.b64encode(encoded.tobytes()).decode("ascii") if ok else None,
+    }
+
+class EventSink(abc.ABC):
+    """Base class for notifier sinks - events are written in batches on a worker thread"""
+    name = "event"
+    
+    def __init__(self, batch_size=NOTIFIER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.queue = BoundedQueue()
+        self.running = True
+        self.sent = 0
+        self.failed = 0
+        
+        # Called with (sink name, events) for batches that could not be delivered
+        self.spool = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def emit(self, event):
+        """Queue an event without blocking the caller"""
+        self.queue.put(event)
+    
+    def _run(self):
+        while self.running or not self.queue.empty():
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            
+            # Send immediately, taking along whatever else is already waiting
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                self.write_batch(batch)
+                self.sent += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"Error in {self.name} notifier: {e}")
+                if self.spool:
+                    self.spool(self.name, batch)
+    
+    @abc.abstractmethod
+    def write_batch(self, events):
+        """Deliver a list of events; raise to have them counted as failed and spooled"""
+    
+    def close(self, timeout=2.0):
+        """Stop the worker once the queue is empty; events still queued at the timeout are spooled"""
+        self.running = False
+        self.thread.join(timeout)
+        
+        leftover = []
+        while True:
+            try:
+                leftover.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover and self.spool:
+            self.spool(self.name, leftover)
+        return not self.thread.is_alive() and not leftover
+
+class JsonlSink(EventSink):
+    """Appends one JSON event per line to a local file"""
+    name = "JSONL"
+    
+    def __init__(self, path, **kwargs):
+        self.path = path
+        super().__init__(**kwargs)
+    
+    def write_batch(self, events):
+        lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+class WebhookSink(EventSink):
+    """POSTs batches of events to an HTTP endpoint as a JSON array"""
+    name = "webhook"
+    
+    def __init__(self, url, timeout=5.0, **kwargs):
+        self.url = url
+        self.timeout = timeout
+        super().__init__(**kwargs)
+    
+    def write_batch(self, events):
+        body = json.dumps(events, separators=(",", ":")).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class UnixSocketSink(EventSink):
+    """Streams one JSON event per line to a local Unix socket"""
+    name = "Unix socket"
+    
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.connection = None
+        super().__init__(**kwargs)
+    
+    def write_batch(self, events):
+        lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+        try:
+            if self.connection is None:
+                self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.connection.settimeout(5.0)
+                self.connection.connect(self.path)
+            self.connection.sendall(lines.encode("utf-8"))
+        except OSError:
+            # Reconnect on the next batch
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            raise
+    
+    def close(self, timeout=2.0):
+        drained = super().close(timeout)
+        if self.connection is not None:
+            self.connection.close()
+        return drained
+
+class Notifier:
+    """Fans capture events out to every configured sink"""
+    def __init__(self, sinks=None):
+        self.sinks = sinks if sinks is not None else self.create_default_sinks()
+    
+    @staticmethod
+    def create_default_sinks():
+        """Create the sinks enabled by the module settings"""
+        sinks = []
+        if NOTIFIER_JSONL_PATH:
+            sinks.append(JsonlSink(NOTIFIER_JSONL_PATH))
+        if NOTIFIER_WEBHOOK_URL:
+            sinks.append(WebhookSink(NOTIFIER_WEBHOOK_URL))
+        if NOTIFIER_SOCKET_PATH:
+            if hasattr(socket, "AF_UNIX"):
+                sinks.append(UnixSocketSink(NOTIFIER_SOCKET_PATH))
+            else:
+                print("Error: Unix sockets are not supported on this platform")
+        return sinks
+    
+    def publish(self, event):
+        for sink in self.sinks:
+            sink.emit(event)
+    
+    def sink(self, name):
+        """The sink with the given name, or None"""
+        return next((sink for sink in self.sinks if sink.name == name), None)
+    
+    def close(self, timeout=2.0):
+        """Flush every sink within the timeout; returns False if any events were left over"""
+        end = time.time() + timeout
+        drained = True
+        for sink in self.sinks:
+            drained = sink.close(max(0.0, end - time.time())) and drained
+        return drained
+
+# Email bodies - built once and only filled in with the capture time
+EMAIL_HTML_TEMPLATE = """
+            <html>
+            <body style="font-family: 'Segoe UI', Arial, sans-serif; color: #333333; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f5f5f7;">
+                <div style="background-color: #ffffff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                    <h2 style="color: #4a6cd4; margin-top: 0;">New Smile Detected! 😄</h2>
+                    <p>Hello,</p>
+                    <p>Your Smile Detection App has captured a new smile at <b>{current_time}</b>.</p>
+                    <p>The captured image is attached to this email.</p>
+                    <div style="margin: 20px 0; padding: 15px; background-color: #f0f4ff; border-left: 4px solid #4a6cd4; border-radius: 4px;">
+                        <p style="margin: 0; color: #555;">Smile Detection App is automatically capturing your best moments!</p>
+                    </div>
+                    <p>Best regards,<br>
+                    Your Smile Detection App</p>
+                </div>
+            </body>
+            </html>
+            """
+
+EMAIL_TEXT_TEMPLATE = """
+            New Smile Detected!
+            
+            Hello,
+            
+            Your Smile Detection App has captured a new smile at {current_time}.
+            The captured image is attached to this email.
+            
+            Best regards,
+            Your Smile Detection App
+            """
+
+# Email attachment settings - captures are re-encoded before they are sent
+ATTACHMENT_MAX_DIMENSION = 1280  # Longest side of the attached image (pixels)
+ATTACHMENT_QUALITY = 80          # Starting JPEG quality
+ATTACHMENT_MIN_QUALITY = 40      # Quality floor before the image is shrunk further
+ATTACHMENT_MAX_BYTES = 400 * 1024  # Byte budget per message, including encoding and bodies
+ATTACHMENT_HEADER_OVERHEAD = 2048  # MIME headers and boundaries of a message
+ATTACHMENT_CROP_TO_FACES = False # Attach only the region around the detected faces
+ATTACHMENT_CACHE_SIZE = 32       # Encoded attachments kept in memory
+
+class AttachmentEncoder:
+    """Re-encodes captures for email within a size budget and caches the result"""
+    def __init__(self, max_dimension=ATTACHMENT_MAX_DIMENSION, quality=ATTACHMENT_QUALITY,
+                 min_quality=ATTACHMENT_MIN_QUALITY, max_bytes=ATTACHMENT_MAX_BYTES,
+                 crop_to_faces=ATTACHMENT_CROP_TO_FACES, cache_size=ATTACHMENT_CACHE_SIZE):
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_bytes = max_bytes
+        self.crop_to_faces = crop_to_faces
+        self.cache_size = cache_size
+        
+        # LRU cache keyed by file, modification time and crop boxes
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def encode(self, image_path, boxes=None, max_bytes=None):
+        """Return JPEG bytes for the capture, or None if it can't be read"""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        crop_boxes = tuple(tuple(int(v) for v in box[:4]) for box in boxes) if self.crop_to_faces and boxes else None
+        try:
+            key = (image_path, os.path.getmtime(image_path), crop_boxes, max_bytes,
+                   self.max_dimension, self.quality)
+        except OSError:
+            return None
+        
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+        
+        image = cv2.imread(image_path)
+        if image is None:
+            return None
+        if crop_boxes:
+            image = self.crop(image, crop_boxes)
+        data = self.compress(image, self.image_budget(max_bytes))
+        
+        with self.lock:
+            self.misses += 1
+            self.cache[key] = data
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return data
+    
+    @staticmethod
+    def image_budget(message_bytes):
+        """Raw JPEG bytes that fit a message budget once base64-encoded next to the email bodies"""
+        # MIME base64 grows data by 4/3 plus a line break every 76 characters
+        expansion = 4 / 3 * 78 / 76
+        bodies = len(EMAIL_HTML_TEMPLATE.encode("utf-8")) + len(EMAIL_TEXT_TEMPLATE.encode("utf-8"))
+        available = message_bytes - ATTACHMENT_HEADER_OVERHEAD - bodies * expansion
+        return max(1024, int(available / expansion))
+    
+    def crop(self, image, boxes, margin=0.25):
+        """Crop to the union of the face boxes plus a margin"""
+        height, width = image.shape[:2]
+        x1 = min(x - int(w * margin) for x, y, w, h in boxes)
+        y1 = min(y - int(h * margin) for x, y, w, h in boxes)
+        x2 = max(x + w + int(w * margin) for x, y, w, h in boxes)
+        y2 = max(y + h + int(h * margin) for x, y, w, h in boxes)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 <= x1 or y2 <= y1:
+            return image
+        return image[y1:y2, x1:x2]
+    
+    def compress(self, image, max_bytes):
+        """Downscale and lower quality step by step until the JPEG fits the budget"""
+        height, width = image.shape[:2]
+        if max(height, width) > self.max_dimension:
+            scale = self.max_dimension / max(height, width)
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        
+        quality = self.quality
+        while True:
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            data = encoded.tobytes()
+            if len(data) <= max_bytes:
+                return data
+            if quality > self.min_quality:
+                quality = max(self.min_quality, quality - 10)
+            elif min(image.shape[:2]) > 64:
+                image = cv2.resize(image, None, fx=0.75, fy=0.75, interpolation=cv2.INTER_AREA)
+            else:
+                # Can't get any smaller - send what we have
+                return data
+
+# Capture storage settings
+STORAGE_MODE = "full"            # "full" saves the annotated frame, "faces" saves face crops only
+STORAGE_CONTEXT_SCALE = 0.25     # Size of the context frame saved in "faces" mode (0 disables it)
+STORAGE_CROP_MARGIN = 0.15       # Margin added around each face crop
+STORAGE_QUALITY = 90             # JPEG quality of saved crops and context frames
+SIDECAR_VERSION = 1
+INDEX_FILE = "captures.sqlite"   # Searchable capture metadata, kept in the save directory
+
+class CaptureStore:
+    """Saves captures with a compact JSON sidecar describing faces, smiles and parameters"""
+    def __init__(self, directory=SAVE_DIRECTORY, mode=STORAGE_MODE, context_scale=STORAGE_CONTEXT_SCALE,
+                 crop_margin=STORAGE_CROP_MARGIN, quality=STORAGE_QUALITY):
+        self.directory = directory
+        self.mode = mode
+        self.context_scale = context_scale
+        self.crop_margin = crop_margin
+        self.quality = quality
+        # Clean face crops in "full" mode too, for consumers that need pixels without overlays
+        self.crop_faces = False
+        os.makedirs(self.directory, exist_ok=True)
+    
+    @property
+    def needs_raw_frame(self):
+        """Whether save() wants a copy of the frame taken before the overlays are drawn"""
+        return self.mode == "faces" or self.crop_faces
+    
+    @staticmethod
+    def capture_id_for(image_path):
+        """Capture ID shared by all files of a capture, e.g. face_20240101_120000"""
+        return os.path.basename(image_path).split('.')[0]
+    
+    def sidecar_path(self, capture_id):
+        return os.path.join(self.directory, f"{capture_id}.json")
+    
+    def new_capture_id(self):
+        """Timestamped capture ID that doesn't clash with an existing capture"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        capture_id = f"face_{timestamp}"
+        
+        # Don't overwrite captures taken within the same second (fast replays)
+        suffix = 1
+        while (os.path.exists(self.sidecar_path(capture_id)) or
+               os.path.exists(os.path.join(self.directory, f"{capture_id}.jpg"))):
+            capture_id = f"face_{timestamp}_{suffix}"
+            suffix += 1
+        return capture_id
+    
+    def save(self, annotated_frame, detections, raw_frame=None, detect_scale=1.0):
+        """Write a capture and its sidecar; returns (capture_id, gallery image path)
+        
+        Returns (None, None) without writing anything in face-crop mode when there are neither
+        faces nor a context frame to save.
+        """
+        if self.mode == "faces" and not detections and not self.context_scale:
+            return None, None
+        capture_id = self.new_capture_id()
+        height, width = annotated_frame.shape[:2]
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        sidecar = {
+            "v": SIDECAR_VERSION,
+            "id": capture_id,
+            "time": round(time.time(), 3),
+            "frame": [width, height],
+            "mode": self.mode,
+            "image": None,
+            "context": None,
+            "context_scale": None,
+            "faces": [],
+            "params": {
+                "face": FACE_DETECTION_PARAMS,
+                "smile": SMILE_DETECTION_PARAMS,
+                "scale": detect_scale,
+            },
+        }
+        
+        if self.mode == "faces":
+            # Crop from the clean frame so the overlays aren't stored
+            source = raw_frame if raw_frame is not None else annotated_frame
+            self.save_face_crops(capture_id, source, detections, sidecar["faces"], params)
+            
+            if self.context_scale:
+                context = cv2.resize(annotated_frame, (max(1, int(width * self.context_scale)),
+                                                       max(1, int(height * self.context_scale))),
+                                     interpolation=cv2.INTER_AREA)
+                sidecar["context"] = f"{capture_id}.context.jpg"
+                sidecar["context_scale"] = self.context_scale
+                cv2.imwrite(os.path.join(self.directory, sidecar["context"]), context, params)
+        else:
+            sidecar["image"] = f"{capture_id}.jpg"
+            cv2.imwrite(os.path.join(self.directory, sidecar["image"]), annotated_frame)
+            if self.crop_faces and raw_frame is not None:
+                self.save_face_crops(capture_id, raw_frame, detections, sidecar["faces"], params)
+            else:
+                for (x, y, w, h), smiles in detections:
+                    sidecar["faces"].append(self.face_entry((x, y, w, h), smiles))
+        
+        with open(self.sidecar_path(capture_id), "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, separators=(",", ":"))
+        return capture_id, self.gallery_image(sidecar)
+    
+    def save_face_crops(self, capture_id, source, detections, faces, params):
+        """Write a crop with margin for every face and append its sidecar entry to faces"""
+        height, width = source.shape[:2]
+        for index, ((x, y, w, h), smiles) in enumerate(detections):
+            mx, my = int(w * self.crop_margin), int(h * self.crop_margin)
+            x1, y1 = max(0, x - mx), max(0, y - my)
+            x2, y2 = min(width, x + w + mx), min(height, y + h + my)
+            crop_name = f"{capture_id}.face{index}.jpg"
+            cv2.imwrite(os.path.join(self.directory, crop_name), source[y1:y2, x1:x2], params)
+            faces.append(self.face_entry((x, y, w, h), smiles, crop_name, [x1, y1, x2 - x1, y2 - y1]))
+    
+    @staticmethod
+    def face_entry(box, smiles, crop=None, crop_box=None):
+        entry = {
+            "box": [int(v) for v in box],
+            "smiling": len(smiles) > 0,
+            "smiles": [[int(v) for v in smile] for smile in smiles],
+        }
+        if crop:
+            entry["crop"] = crop
+            entry["crop_box"] = crop_box
+        return entry
+    
+    def gallery_image(self, sidecar):
+        """Image shown in the gallery: full frame, context frame or first face crop"""
+        name = sidecar.get("image") or sidecar.get("context")
+        if not name and sidecar.get("faces"):
+            name = sidecar["faces"][0].get("crop")
+        return os.path.join(self.directory, name) if name else None
+    
+    def load_sidecar(self, image_path):
+        """Sidecar of the capture an image belongs to, or None for legacy captures"""
+        try:
+            with open(self.sidecar_path(self.capture_id_for(image_path)), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def boxes_for_image(self, image_path):
+        """Face boxes in the coordinates of the given image, read from the sidecar"""
+        sidecar = self.load_sidecar(image_path)
+        if sidecar is None:
+            return None
+        name = os.path.basename(image_path)
+        boxes = [face["box"] for face in sidecar["faces"]]
+        if name == sidecar.get("image"):
+            return boxes
+        if name == sidecar.get("context"):
+            scale = sidecar["context_scale"]
+            return [[int(v * scale) for v in box] for box in boxes]
+        # A face crop is already cropped
+        return None
+    
+    def capture_files(self, image_path):
+        """Every file that belongs to the capture of an image"""
+        files = [image_path]
+        sidecar = self.load_sidecar(image_path)
+        if sidecar is not None:
+            names = [sidecar.get("image"), sidecar.get("context")]
+            names += [face.get("crop") for face in sidecar["faces"]]
+            files += [os.path.join(self.directory, name) for name in names if name]
+            files.append(self.sidecar_path(sidecar["id"]))
+        return list(dict.fromkeys(files))
+    
+    def list_images(self):
+        """One gallery image per capture, including legacy images without a sidecar"""
+        if not os.path.exists(self.directory):
+            return []
+        names = os.listdir(self.directory)
+        images = []
+        captured = set()
+        for name in names:
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        sidecar = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                captured.add(sidecar.get("id"))
+                image_path = self.gallery_image(sidecar)
+                if image_path:
+                    images.append(image_path)
+        for name in names:
+            # Legacy full-frame captures; crops and context frames have an extra part in the name
+            if name.endswith(('.jpg', '.jpeg', '.png')) and name.count('.') == 1 and name.split('.')[0] not in captured:
+                images.append(os.path.join(self.directory, name))
+        return images
+
+CAPTURE_INSERT = "INSERT OR REPLACE INTO captures (id, image, time, faces, smiling, mtime) VALUES (?, ?, ?, ?, ?, ?)"
+
+class CaptureIndex:
+    """SQLite index of capture metadata so the gallery can be searched without opening every file"""
+    def __init__(self, store, filename=INDEX_FILE):
+        self.store = store
+        self.filename = filename
+        self.directory = None
+        self.connection = None
+        self.lock = threading.Lock()
+    
+    def _connect(self):
+        """Connection to the index of the current save directory; call with the lock held"""
+        if self.connection is None or self.directory != self.store.directory:
+            if self.connection is not None:
+                self.connection.close()
+            self.directory = self.store.directory
+            self.connection = sqlite3.connect(os.path.join(self.directory, self.filename),
+                                              check_same_thread=False)
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS captures ("
+                    "id TEXT PRIMARY KEY, image TEXT NOT NULL, time REAL NOT NULL, "
+                    "faces INTEGER, smiling INTEGER, mtime REAL, clustered INTEGER DEFAULT 0)"
+                )
+                columns = [row[1] for row in self.connection.execute("PRAGMA table_info(captures)")]
+                if "clustered" not in columns:
+                    self.connection.execute("ALTER TABLE captures ADD COLUMN clustered INTEGER DEFAULT 0")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS captures_time ON captures (time)")
+                self.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS captures_attributes ON captures (smiling, faces, time)"
+                )
+                
+                # Person assigned to each face by the identity clusterer
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS identities ("
+                    "capture_id TEXT, face_index INTEGER, person INTEGER, descriptor BLOB, "
+                    "PRIMARY KEY (capture_id, face_index))"
+                )
+                self.connection.execute("CREATE INDEX IF NOT EXISTS identities_person ON identities (person)")
+        return self.connection
+    
+    def row_for_sidecar(self, path):
+        """Index row for a sidecar file, or None if it isn't a readable sidecar"""
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, encoding="utf-8") as f:
+                sidecar = json.load(f)
+            image_path = self.store.gallery_image(sidecar)
+            if not image_path:
+                return None
+            faces = sidecar["faces"]
+            return (sidecar["id"], image_path, sidecar["time"], len(faces),
+                    sum(1 for face in faces if face["smiling"]), mtime)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+    
+    @staticmethod
+    def row_for_legacy_image(path):
+        """Index row for an image without a sidecar - faces and smiles are unknown"""
+        capture_id = CaptureStore.capture_id_for(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        try:
+            capture_time = datetime.datetime.strptime(capture_id[5:20], "%Y%m%d_%H%M%S").timestamp()
+        except ValueError:
+            capture_time = mtime
+        return (capture_id, path, capture_time, None, None, mtime)
+    
+    def add(self, capture_id):
+        """Index a capture that was just saved"""
+        row = self.row_for_sidecar(self.store.sidecar_path(capture_id))
+        if row is None:
+            return
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(CAPTURE_INSERT, row)
+    
+    def sync(self):
+        """Bring the index in line with the save directory, reading only new or changed sidecars"""
+        with self.lock:
+            directory = self.store.directory
+            known = dict(self._connect().execute("SELECT id, mtime FROM captures"))
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        
+        rows = []
+        present = set()
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            capture_id = name[:-len(".json")]
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if known.get(capture_id) == mtime:
+                present.add(capture_id)
+                continue
+            row = self.row_for_sidecar(path)
+            if row is not None:
+                present.add(row[0])
+                rows.append(row)
+        for name in names:
+            # Legacy full-frame captures; crops and context frames have an extra part in the name
+            if name.endswith(('.jpg', '.jpeg', '.png')) and name.count('.') == 1:
+                capture_id = name.split('.')[0]
+                if capture_id in present:
+                    continue
+                present.add(capture_id)
+                if capture_id not in known:
+                    row = self.row_for_legacy_image(os.path.join(directory, name))
+                    if row is not None:
+                        rows.append(row)
+        stale = [(capture_id,) for capture_id in known if capture_id not in present]
+        
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(CAPTURE_INSERT, rows)
+                connection.executemany("DELETE FROM captures WHERE id = ?", stale)
+                connection.executemany("DELETE FROM identities WHERE capture_id = ?", stale)
+    
+    def remove(self, paths):
+        """Drop the captures the given files belong to in one transaction"""
+        capture_ids = {(CaptureStore.capture_id_for(path),) for path in paths}
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("DELETE FROM captures WHERE id = ?", capture_ids)
+                connection.executemany("DELETE FROM identities WHERE capture_id = ?", capture_ids)
+    
+    @staticmethod
+    def where_clause(start=None, end=None, smiling=None, min_faces=0, capture_id=None):
+        """SQL condition and values for a gallery filter"""
+        conditions = []
+        values = []
+        if start is not None:
+            conditions.append("time >= ?")
+            values.append(start)
+        if end is not None:
+            conditions.append("time < ?")
+            values.append(end)
+        if smiling is not None:
+            conditions.append("smiling > 0" if smiling else "smiling = 0")
+        if min_faces:
+            conditions.append("faces >= ?")
+            values.append(min_faces)
+        if capture_id is not None:
+            conditions.append("id = ?")
+            values.append(capture_id)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", values
+    
+    def search(self, **gallery_filter):
+        """Gallery images of the matching captures, oldest first
+        
+        The filter takes start and end timestamps, smiling (True, False or None for either),
+        min_faces and capture_id. Legacy captures without a sidecar only match when no
+        attribute filter is set.
+        """
+        where, values = self.where_clause(**gallery_filter)
+        query = f"SELECT image FROM captures{where} ORDER BY time"
+        with self.lock:
+            return [row[0] for row in self._connect().execute(query, values)]
+    
+    def search_by_person(self, **gallery_filter):
+        """(person, image) for the matching captures, grouped by person
+        
+        A capture with several people is listed under each of them; captures that
+        haven't been clustered yet come last with person None.
+        """
+        where, values = self.where_clause(**gallery_filter)
+        query = (f"SELECT DISTINCT identities.person, image, time FROM captures "
+                 f"LEFT JOIN identities ON identities.capture_id = captures.id{where} "
+                 f"ORDER BY identities.person IS NULL, identities.person, time")
+        with self.lock:
+            return [(person, image) for person, image, _ in self._connect().execute(query, values)]
+    
+    def unclustered(self, limit):
+        """IDs of captures with faces that have no person assigned yet"""
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT id FROM captures WHERE clustered = 0 AND faces > 0 ORDER BY time LIMIT ?", (limit,)
+            )
+            return [row[0] for row in rows]
+    
+    def face_descriptors(self):
+        """(person, descriptor bytes) of every clustered face"""
+        with self.lock:
+            return list(self._connect().execute("SELECT person, descriptor FROM identities ORDER BY rowid"))
+    
+    def save_identities(self, capture_id, rows):
+        """Store (face index, person, descriptor bytes) for a capture and mark it clustered"""
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM identities WHERE capture_id = ?", (capture_id,))
+                connection.executemany("INSERT INTO identities VALUES (?, ?, ?, ?)",
+                                       [(capture_id,) + tuple(row) for row in rows])
+                connection.execute("UPDATE captures SET clustered = 1 WHERE id = ?", (capture_id,))
+    
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+# Identity clustering settings - groups captures by person, off by default
+IDENTITY_CLUSTERING_ENABLED = False
+IDENTITY_FACE_SIZE = 64          # Faces are resized to this square before the descriptor is computed
+IDENTITY_GRID = 4                # LBP histograms per row and column of the face
+IDENTITY_MATCH_THRESHOLD = 0.92  # Similarity (0-1) above which a face joins the nearest person
+IDENTITY_LSH_TABLES = 8          # Hash tables of the nearest-neighbour index
+IDENTITY_LSH_BITS = 8            # Hyperplanes per table
+IDENTITY_LSH_WARMUP = 100        # Faces searched exhaustively while the index learns its centre
+IDENTITY_BACKLOG_BATCH = 20      # Older captures clustered per idle pass
+
+def uniform_lbp_table():
+    """Map each 8-bit LBP code to one of 58 uniform patterns, or bin 58 for all others"""
+    table = []
+    uniform = 0
+    for code in range(256):
+        transitions = sum(((code >> i) & 1) != ((code >> ((i + 1) % 8)) & 1) for i in range(8))
+        if transitions <= 2:
+            table.append(uniform)
+            uniform += 1
+        else:
+            table.append(58)
+    return table
+
+LBP_BINS = 59
+LBP_TABLE = uniform_lbp_table()
+
+def lbp_descriptor(face):
+    """Unit-length descriptor of a grayscale face from a grid of uniform LBP histograms
+    
+    The square roots of the normalised histograms are used, so the dot product of two
+    descriptors is the mean Bhattacharyya coefficient of their histograms.
+    """
+    face = cv2.resize(face, (IDENTITY_FACE_SIZE, IDENTITY_FACE_SIZE), interpolation=cv2.INTER_AREA)
+    face = cv2.equalizeHist(face)
+    
+    # Compare each pixel with its 8 neighbours
+    height, width = face.shape
+    center = face[1:-1, 1:-1]
+    codes = np.zeros(center.shape, np.uint8)
+    neighbours = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+    for bit, (dy, dx) in enumerate(neighbours):
+        neighbour = face[1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        codes |= (neighbour >= center).astype(np.uint8) << bit
+    labels = np.asarray(LBP_TABLE, np.uint8)[codes]
+    
+    # One histogram per grid cell keeps the layout of the face
+    cell = labels.shape[0] // IDENTITY_GRID
+    histograms = []
+    for row in range(IDENTITY_GRID):
+        for col in range(IDENTITY_GRID):
+            block = labels[row * cell:(row + 1) * cell, col * cell:(col + 1) * cell]
+            histograms.append(np.bincount(block.ravel(), minlength=LBP_BINS) / block.size)
+    descriptor = np.sqrt(np.concatenate(histograms)).astype(np.float32)
+    return descriptor / np.float32(np.sqrt(IDENTITY_GRID * IDENTITY_GRID))
+
+class HyperplaneLSH:
+    """Approximate cosine nearest-neighbour index using random-hyperplane hashing
+    
+    Queries also probe the buckets one bit away from their own, which finds most near
+    neighbours with few tables.
+    """
+    def __init__(self, dim, tables=IDENTITY_LSH_TABLES, bits=IDENTITY_LSH_BITS, warmup=IDENTITY_LSH_WARMUP, seed=0):
+        rng = np.random.default_rng(seed)
+        self.planes = [rng.standard_normal((bits, dim)).astype(np.float32) for _ in range(tables)]
+        self.weights = 1 << np.arange(bits)
+        self.probes = [0] + [1 << bit for bit in range(bits)]
+        self.buckets = [{} for _ in range(tables)]
+        self.warmup = warmup
+        self.center = None
+        self.vectors = []
+        self.labels = []
+    
+    def _keys(self, vector):
+        # Descriptors are all non-negative, so hash them relative to their mean
+        centered = vector - self.center
+        return [int((planes @ centered > 0) @ self.weights) for planes in self.planes]
+    
+    def _hash(self, index):
+        for bucket, key in zip(self.buckets, self._keys(self.vectors[index])):
+            bucket.setdefault(key, []).append(index)
+    
+    def add(self, vector, label):
+        self.vectors.append(vector)
+        self.labels.append(label)
+        if self.center is not None:
+            self._hash(len(self.vectors) - 1)
+        elif len(self.vectors) >= self.warmup:
+            # Enough samples to centre the hyperplanes - hash everything seen so far
+            self.center = np.mean(self.vectors, axis=0)
+            for index in range(len(self.vectors)):
+                self._hash(index)
+    
+    def nearest(self, vector):
+        """(label, similarity) of the most similar vector found, or (None, 0.0)"""
+        if self.center is None:
+            candidates = range(len(self.vectors))
+        else:
+            found = set()
+            for bucket, key in zip(self.buckets, self._keys(vector)):
+                for probe in self.probes:
+                    found.update(bucket.get(key ^ probe, ()))
+            candidates = sorted(found)
+        if not candidates:
+            return None, 0.0
+        similarities = np.stack([self.vectors[i] for i in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        return self.labels[candidates[best]], float(similarities[best])
+
+class IdentityClusterer:
+    """Assigns a person ID to every saved face on a background thread"""
+    def __init__(self, store, index, threshold=IDENTITY_MATCH_THRESHOLD):
+        self.store = store
+        self.index = index
+        self.threshold = threshold
+        self.jobs = BoundedQueue()
+        self.lsh = HyperplaneLSH(IDENTITY_GRID * IDENTITY_GRID * LBP_BINS)
+        self.next_person = 1
+        self.faces_clustered = 0
+        
+        # Older captures are looked up only when there may be some left
+        self.backlog_pending = True
+        self.dropped_seen = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def submit(self, capture_id):
+        """Queue a saved capture; captures dropped from a full queue are picked up later"""
+        self.jobs.put(capture_id)
+    
+    def check_backlog(self):
+        """Look for unclustered captures again, e.g. after the index was synced"""
+        self.backlog_pending = True
+    
+    def _run(self):
+        # Rebuild the index from the faces clustered in earlier runs
+        for person, descriptor in self.index.face_descriptors():
+            self.lsh.add(np.frombuffer(descriptor, np.float32), person)
+            self.next_person = max(self.next_person, person + 1)
+        
+        while self.running:
+            try:
+                capture_ids = [self.jobs.get(timeout=1.0)]
+            except queue.Empty:
+                # Catch up on older captures, and any dropped from the queue, while idle
+                if not self.backlog_pending and self.jobs.dropped == self.dropped_seen:
+                    continue
+                self.dropped_seen = self.jobs.dropped
+                self.backlog_pending = False
+                capture_ids = self.index.unclustered(IDENTITY_BACKLOG_BATCH)
+                if len(capture_ids) == IDENTITY_BACKLOG_BATCH:
+                    self.backlog_pending = True
+            for capture_id in capture_ids:
+                if not self.running:
+                    break
+                try:
+                    self.cluster(capture_id)
+                except Exception as e:
+                    print(f"Error clustering {capture_id}: {e}")
+                    self.index.save_identities(capture_id, [])
+    
+    def face_images(self, capture_id):
+        """(face index, grayscale face) for every face of a capture"""
+        sidecar = self.store.load_sidecar(self.store.sidecar_path(capture_id))
+        if sidecar is None:
+            return []
+        faces = []
+        frame = None
+        for face_index, face in enumerate(sidecar["faces"]):
+            x, y, w, h = face["box"]
+            if face.get("crop"):
+                # Clean face crop - cut the margin back off
+                image = cv2.imread(os.path.join(self.store.directory, face["crop"]), cv2.IMREAD_GRAYSCALE)
+                if image is None:
+                    continue
+                crop_x, crop_y = face["crop_box"][:2]
+                image = image[y - crop_y:y - crop_y + h, x - crop_x:x - crop_x + w]
+            else:
+                if frame is None:
+                    frame = cv2.imread(self.store.gallery_image(sidecar), cv2.IMREAD_GRAYSCALE)
+                    if frame is None:
+                        break
+                # Older "full" captures without crops - stay inside the drawn face box
+                margin = w // 10
+                image = frame[y + margin:y + h - margin, x + margin:x + w - margin]
+            if image.size:
+                faces.append((face_index, image))
+        return faces
+    
+    def cluster(self, capture_id):
+        """Give every face of a capture the person of its nearest match, or a new person"""
+        rows = []
+        for face_index, face in self.face_images(capture_id):
+            descriptor = lbp_descriptor(face)
+            person, similarity = self.lsh.nearest(descriptor)
+            if person is None or similarity < self.threshold:
+                person = self.next_person
+                self.next_person += 1
+            self.lsh.add(descriptor, person)
+            rows.append((face_index, person, descriptor.tobytes()))
+        self.index.save_identities(capture_id, rows)
+        self.faces_clustered += len(rows)
+    
+    def close(self, timeout=2.0):
+        """Stop after the current capture; the rest is clustered on the next start"""
+        self.running = False
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+class ThumbnailCache:
+    """Keeps at most max_items decoded gallery thumbnails, evicting the least recently used"""
+    def __init__(self, max_items=THUMBNAIL_CACHE_SIZE, size=THUMBNAIL_SIZE, on_evict=None):
+        self.max_items = max_items
+        self.size = size
+        self.on_evict = on_evict
+        self.items = OrderedDict()
+        # Captures are added from the video thread, scrolling loads them on the UI thread
+        self.lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+    
+    def get(self, image_path):
+        """Return the PhotoImage for an image, decoding it if it isn't resident"""
+        with self.lock:
+            if image_path in self.items:
+                self.items.move_to_end(image_path)
+                return self.items[image_path]
+            
+            img = Image.open(image_path)
+            # Let the JPEG decoder skip detail we are going to throw away
+            img.draft("RGB", self.size)
+            img = img.resize(self.size, Image.LANCZOS)
+            photo = ImageTk.PhotoImage(img)
+            self.loads += 1
+            
+            self.items[image_path] = photo
+            while len(self.items) > self.max_items:
+                evicted, _ = self.items.popitem(last=False)
+                self.evictions += 1
+                if self.on_evict:
+                    self.on_evict(evicted)
+            return photo
+    
+    def discard(self, image_path):
+        with self.lock:
+            self.items.pop(image_path, None)
+    
+    @property
+    def resident_bytes(self):
+        """Approximate memory of the resident thumbnails (32-bit pixels)"""
+        return len(self.items) * self.size[0] * self.size[1] * 4
+
+class RetentionPolicy:
+    """Prunes the oldest captures on disk by age and by total size"""
+    def __init__(self, directory=SAVE_DIRECTORY, max_age_days=RETENTION_MAX_AGE_DAYS,
+                 max_total_mb=RETENTION_MAX_TOTAL_MB):
+        self.directory = directory
+        self.max_age_days = max_age_days
+        self.max_total_mb = max_total_mb
+        self.total_bytes = 0
+        self.capture_count = 0
+        self.pruned = 0
+    
+    def scan(self):
+        """Group capture files by capture ID with their size and age"""
+        groups = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return groups
+        for entry in entries:
+            if not entry.is_file() or not entry.name.startswith(CAPTURE_PREFIXES):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            group = groups.setdefault(entry.name.split('.')[0], {"paths": [], "bytes": 0, "mtime": stat.st_mtime})
+            group["paths"].append(entry.path)
+            group["bytes"] += stat.st_size
+            group["mtime"] = min(group["mtime"], stat.st_mtime)
+        return groups
+    
+    def prune(self):
+        """Delete captures outside the budget; returns the deleted file paths"""
+        groups = self.scan()
+        self.total_bytes = sum(group["bytes"] for group in groups.values())
+        self.capture_count = len(groups)
+        
+        oldest_first = sorted(groups, key=lambda key: groups[key]["mtime"])
+        expired = set()
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            expired = {key for key in oldest_first if groups[key]["mtime"] < cutoff}
+        if self.max_total_mb is not None:
+            budget = self.max_total_mb * 1024 * 1024
+            total = sum(group["bytes"] for key, group in groups.items() if key not in expired)
+            for key in oldest_first:
+                if total <= budget:
+                    break
+                if key not in expired:
+                    expired.add(key)
+                    total -= groups[key]["bytes"]
+        
+        removed = []
+        for key in expired:
+            group = groups[key]
+            for path in group["paths"]:
+                try:
+                    os.remove(path)
+                    removed.append(path)
+                except OSError as e:
+                    print(f"Error removing {path}: {e}")
+            self.total_bytes -= group["bytes"]
+            self.capture_count -= 1
+            self.pruned += 1
+        return removed
+
+# Smile clip recording settings
+CLIP_RECORDING_ENABLED = False   # Record a short clip around every smile
+CLIP_PRE_ROLL = 2.0              # Seconds kept before the smile
+CLIP_POST_ROLL = 3.0             # Seconds recorded after the last smile
+CLIP_MAX_LENGTH = 15.0           # Longest clip before a new one is started
+CLIP_JPEG_QUALITY = 80           # Quality of the compressed frames in the pre-roll buffer
+CLIP_MAX_BUFFER_MB = 16          # Memory cap for the pre-roll buffer
+CLIP_QUEUE_FRAMES = 4            # Raw frames waiting for compression; the oldest is dropped beyond this
+CLIP_CODEC = "mp4v"
+
+class EventClipRecorder:
+    """Keeps a JPEG-compressed pre-roll and writes a clip around each smile on background threads"""
+    def __init__(self, directory=SAVE_DIRECTORY, pre_roll=CLIP_PRE_ROLL, post_roll=CLIP_POST_ROLL,
+                 max_length=CLIP_MAX_LENGTH, quality=CLIP_JPEG_QUALITY, max_buffer_mb=CLIP_MAX_BUFFER_MB,
+                 codec=CLIP_CODEC):
+        self.directory = directory
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_length = max_length
+        self.quality = quality
+        self.max_buffer_bytes = max_buffer_mb * 1024 * 1024
+        self.codec = codec
+        
+        # Frames from the detection thread, compressed into the pre-roll ring
+        self.frames_in = BoundedQueue(maxsize=CLIP_QUEUE_FRAMES)
+        self.ring = deque()
+        self.ring_bytes = 0
+        
+        # Clip being collected and clips waiting to be encoded
+        self.pending_trigger = None
+        self.recording = None
+        self.clip_jobs = BoundedQueue(maxsize=8)
+        self.clips_written = 0
+        
+        self.running = True
+        self.compress_thread = threading.Thread(target=self._compress_loop, daemon=True)
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.compress_thread.start()
+        self.writer_thread.start()
+    
+    def push(self, frame, timestamp):
+        """Hand a frame to the recorder; the frame must not be modified afterwards"""
+        self.frames_in.put((timestamp, frame))
+    
+    @property
+    def buffered_bytes(self):
+        """Memory held by the pre-roll ring and the raw frames waiting to be compressed"""
+        with self.frames_in.mutex:
+            queued = sum(frame.nbytes for _, frame in self.frames_in.queue)
+        return self.ring_bytes + queued
+    
+    def trigger(self, timestamp):
+        """Start a clip, or extend the current one, around this moment"""
+        self.pending_trigger = timestamp
+    
+    def _compress_loop(self):
+        while self.running or not self.frames_in.empty():
+            try:
+                timestamp, frame = self.frames_in.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            data = encoded.tobytes()
+            
+            trigger, self.pending_trigger = self.pending_trigger, None
+            if trigger is not None:
+                if self.recording is None:
+                    # Start the clip with the buffered pre-roll
+                    frames = [item for item in self.ring if item[0] >= trigger - self.pre_roll]
+                    self.recording = {"frames": frames, "start": trigger, "until": trigger + self.post_roll}
+                elif trigger + self.post_roll - self.recording["start"] <= self.max_length:
+                    self.recording["until"] = trigger + self.post_roll
+            
+            if self.recording is not None:
+                self.recording["frames"].append((timestamp, data))
+                if timestamp >= self.recording["until"] or timestamp - self.recording["start"] >= self.max_length:
+                    self.clip_jobs.put(self.recording["frames"])
+                    self.recording = None
+            
+            # Pre-roll ring, bounded by duration and memory
+            self.ring.append((timestamp, data))
+            self.ring_bytes += len(data)
+            while self.ring and (timestamp - self.ring[0][0] > self.pre_roll or
+                                 self.ring_bytes > self.max_buffer_bytes):
+                self.ring_bytes -= len(self.ring.popleft()[1])
+        
+        # Write whatever was being recorded when stopped
+        if self.recording is not None:
+            self.clip_jobs.put(self.recording["frames"])
+            self.recording = None
+    
+    def _write_loop(self):
+        while self.running or self.compress_thread.is_alive() or not self.clip_jobs.empty():
+            try:
+                frames = self.clip_jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.write_clip(frames)
+            except Exception as e:
+                print(f"Error writing clip: {e}")
+    
+    def write_clip(self, frames):
+        """Decode the compressed frames and write them with cv2.VideoWriter"""
+        if len(frames) < 2:
+            return
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 else 10.0
+        
+        first = cv2.imdecode(np.frombuffer(frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+        height, width = first.shape[:2]
+        
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"clip_{timestamp}.mp4")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"clip_{timestamp}_{suffix}.mp4")
+            suffix += 1
+        
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), fps, (width, height))
+        if not writer.isOpened():
+            print(f"Error: cannot open video writer for {path}")
+            return
+        try:
+            for _, data in frames:
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                if image.shape[:2] != (height, width):
+                    image = cv2.resize(image, (width, height))
+                writer.write(image)
+        finally:
+            writer.release()
+        self.clips_written += 1
+    
+    def close(self, timeout=5.0):
+        """Finish the current clip and stop the workers; returns False if they are still writing"""
+        self.running = False
+        end = time.time() + timeout
+        self.compress_thread.join(timeout)
+        self.writer_thread.join(max(0.0, end - time.time()))
+        return not self.compress_thread.is_alive() and not self.writer_thread.is_alive()
+
+# Shutdown settings - in-flight work is drained, unsent notifications survive a restart
+SHUTDOWN_DEADLINE = 10.0         # Seconds all stages together get to drain on exit
+SPOOL_DIRECTORY = "spool"        # One JSON file per email or event batch that was not sent
+
+class NotificationSpool:
+    """Durable on-disk queue for emails and events that could not be sent"""
+    def __init__(self, directory=SPOOL_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+    
+    def save(self, kind, payload):
+        """Write one item atomically so a crash never leaves a half-written file"""
+        with self.lock:
+            name = f"{time.time():.6f}_{os.getpid()}_{next(self.counter)}.json"
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"kind": kind, "payload": payload}, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Error writing spool file {path}: {e}")
+    
+    def pending(self):
+        """Spooled items, oldest first, as (path, kind, payload)"""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        except OSError:
+            return []
+        items = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    item = json.load(f)
+                items.append((path, item["kind"], item["payload"]))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error reading spool file {path}: {e}")
+        return items
+    
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class EmailWorker:
+    """Sends emails on a background thread so captures never wait for SMTP"""
+    def __init__(self, send, spool):
+        self.send = send
+        self.spool = spool
+        self.queue = queue.Queue(maxsize=QUEUE_MAX_SIZE)
+        self.current = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def submit(self, image_path, cancel=None):
+        """Queue an email; returns False if it wasn't queued
+        
+        Without cancel a full queue sends the email to the spool instead of dropping it. With a
+        cancel event the caller waits for room, e.g. a bulk job, until the event is set.
+        """
+        if cancel is None:
+            try:
+                self.queue.put_nowait(image_path)
+                return True
+            except queue.Full:
+                self.spool.save("email", {"image_path": image_path})
+                return False
+        while self.running and not cancel.is_set():
+            try:
+                self.queue.put(image_path, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _run(self):
+        while self.running or not self.queue.empty():
+            try:
+                self.current = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if not self.send(self.current):
+                # Failed sends are retried on the next start
+                self.spool.save("email", {"image_path": self.current})
+            self.current = None
+    
+    def close(self, timeout=5.0):
+        """Send what is queued within the timeout and spool the rest"""
+        self.running = False
+        self.thread.join(timeout)
+        
+        # Anything not sent yet, including a message still in flight, is sent again on the next start
+        leftover = [self.current] if self.thread.is_alive() and self.current else []
+        while True:
+            try:
+                leftover.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for image_path in leftover:
+            self.spool.save("email", {"image_path": image_path})
+        return not self.thread.is_alive() and not leftover
+
+class LifecycleManager:
+    """Stops the pipeline stages in order within one shared deadline"""
+    def __init__(self):
+        self.stages = []
+    
+    def register(self, name, stop, close):
+        """Add a stage; stop() signals it, close(timeout) drains it and returns True when done"""
+        self.stages.append((name, stop, close))
+    
+    def shutdown(self, deadline=SHUTDOWN_DEADLINE):
+        """Signal every stage, then drain them in registration order; returns {stage: drained}"""
+        end = time.time() + deadline
+        for name, stop, _ in self.stages:
+            if stop:
+                try:
+                    stop()
+                except Exception as e:
+                    print(f"Error stopping {name}: {e}")
+        
+        results = {}
+        for name, _, close in self.stages:
+            try:
+                results[name] = close(max(0.0, end - time.time())) is not False
+            except Exception as e:
+                print(f"Error draining {name}: {e}")
+                results[name] = False
+            if not results[name]:
+                print(f"Warning: {name} did not drain before the shutdown deadline")
+        return results
+
+# External configuration - built-in defaults come from the settings above
+CONFIG_FILE = "smile_detector.json"
+CONFIG_ENV_PREFIX = "SMILE_"     # e.g. SMILE_EMAIL_PASSWORD overrides email.password
+CONFIG_CHECK_INTERVAL = 1.0      # Seconds between checks for a changed config file
+CONFIG_METADATA = {"detection.tuned"}  # Free-form sections written by tools, kept as they are
+
+DEFAULT_CONFIG = {
+    "capture": {
+        "delay": 2.0,                       # Delay between captures in seconds
+        "auto_capture": True,
+        "save_directory": SAVE_DIRECTORY,
+        "storage_mode": STORAGE_MODE,
+        "context_scale": STORAGE_CONTEXT_SCALE,
+    },
+    "email": {
+        "recipient": "",
+        "sender": "",
+        "password": "",                     # Set SMILE_EMAIL_PASSWORD instead of storing it in a file
+        "server": "smtp.gmail.com",
+        "port": 587,
+        "auto_email": True,
+    },
+    "detection": {
+        "face": dict(FACE_DETECTION_PARAMS),
+        "smile": dict(SMILE_DETECTION_PARAMS),
+        "tuned": {},                        # Written by --tune: dataset, accuracy, fps and date
+    },
+    "motion": {
+        "pixel_threshold": MOTION_PIXEL_THRESHOLD,
+        "area_threshold": MOTION_AREA_THRESHOLD,
+        "refresh_interval": MOTION_REFRESH_INTERVAL,
+        "idle_after": MOTION_IDLE_AFTER,
+        "idle_interval": MOTION_IDLE_INTERVAL,
+    },
+    "governor": {
+        "target_latency": GOVERNOR_TARGET_LATENCY,
+        "cpu_target": GOVERNOR_CPU_TARGET,
+    },
+    "clips": {
+        "enabled": CLIP_RECORDING_ENABLED,  # Read at startup
+        "pre_roll": CLIP_PRE_ROLL,
+        "post_roll": CLIP_POST_ROLL,
+        "max_length": CLIP_MAX_LENGTH,
+    },
+    "identity": {
+        "enabled": IDENTITY_CLUSTERING_ENABLED,  # Read at startup
+        "match_threshold": IDENTITY_MATCH_THRESHOLD,
+    },
+    "colors": {
+        "primary": "#4a6cd4",               # Blue as primary color
+        "accent": "#f25d50",                # Coral as accent
+        "background": "#f5f5f7",            # Light gray background
+        "text": "#333333",                  # Dark text
+        "light": "#ffffff",                 # White
+        "face_box": [74, 108, 212],         # Overlay colors are BGR
+        "smile": [0, 255, 0],
+        "no_smile": [0, 0, 255],
+        "label_background": [30, 30, 30],
+    },
+}
+
+class AppConfig:
+    """Settings from a JSON or TOML file plus environment overrides, reloaded when the file changes"""
+    def __init__(self, path=CONFIG_FILE, overrides=None):
+        self.path = path
+        self.overrides = overrides or {}
+        self.mtime = self.file_mtime()
+        try:
+            self.values = self.load()
+        except (OSError, ValueError) as e:
+            print(f"Error loading {self.path}: {e} - using default settings")
+            self.values = self.load(use_file=False)
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def file_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+    
+    def read_file(self):
+        """Parse the config file, or return {} if there isn't one"""
+        if not os.path.exists(self.path):
+            return {}
+        if self.path.endswith(".toml"):
+            if tomllib is None:
+                raise ValueError("TOML config files need Python 3.11 or later")
+            with open(self.path, "rb") as f:
+                return tomllib.load(f)
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+    
+    def load(self, use_file=True):
+        """Defaults, overlaid with the file, environment variables and command line overrides"""
+        values = copy.deepcopy(DEFAULT_CONFIG)
+        if use_file:
+            self.merge(values, self.read_file())
+        
+        # Environment variables keep secrets out of the file
+        for section, entries in values.items():
+            for key, default in entries.items():
+                name = f"{CONFIG_ENV_PREFIX}{section}_{key}".upper()
+                if name not in os.environ or isinstance(default, dict):
+                    continue
+                raw = os.environ[name]
+                try:
+                    value = raw if isinstance(default, str) else json.loads(raw)
+                    self.merge(values, {section: {key: value}})
+                except ValueError:
+                    print(f"Error: ignoring invalid value for {name}")
+        
+        self.merge(values, self.overrides)
+        return values
+    
+    @classmethod
+    def merge(cls, values, updates, section=None):
+        """Recursively merge known sections and keys, so partial files keep the other defaults
+        
+        Raises ValueError for an unknown key or a value of the wrong type; load() then fails as a
+        whole and a reload keeps the previous settings.
+        """
+        for key, value in updates.items():
+            name = f"{section}.{key}" if section else key
+            if key not in values:
+                raise ValueError(f"unknown setting {name}")
+            default = values[key]
+            if isinstance(default, dict):
+                if not isinstance(value, dict):
+                    raise ValueError(f"{name} must be a section")
+                if name in CONFIG_METADATA:
+                    values[key] = value
+                else:
+                    cls.merge(default, value, name)
+            elif not cls.matches(default, value):
+                raise ValueError(f"{name} must be {type(default).__name__}, not {value!r}")
+            else:
+                values[key] = value
+    
+    @staticmethod
+    def matches(default, value):
+        """Whether value can replace default: the same type, an int for a float or a list for a tuple"""
+        if isinstance(default, bool) or isinstance(value, bool):
+            return type(default) is type(value)
+        if isinstance(default, float):
+            return isinstance(value, (int, float))
+        if isinstance(default, (list, tuple)):
+            return (isinstance(value, (list, tuple)) and len(value) == len(default) and
+                    all(AppConfig.matches(d, v) for d, v in zip(default, value)))
+        return isinstance(value, type(default))
+    
+    def get(self, section):
+        return self.values[section]
+    
+    def watch(self, callback, interval=CONFIG_CHECK_INTERVAL):
+        """Call callback(values) from a background thread whenever the file changes"""
+        def run():
+            while not self.stop_event.wait(interval):
+                mtime = self.file_mtime()
+                if mtime == self.mtime:
+                    continue
+                self.mtime = mtime
+                try:
+                    self.values = self.load()
+                except (OSError, ValueError) as e:
+                    # Keep running with the previous settings until the file is fixed
+                    print(f"Error reloading {self.path}: {e}")
+                    continue
+                print(f"Reloaded settings from {self.path}")
+                callback(self.values)
+        
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+
 class FaceDetectionApp:
-    def __init__(self, window, window_title):
+    def __init__(self, window, window_title, capture=None, preview_port=PREVIEW_SERVER_PORT, settings=None,
+                 preview_host=PREVIEW_SERVER_HOST):
         self.window = window
-        self.window.title(window_title)
-        self.window.geometry("1200x700")
         
-        # Set theme colors
-        self.primary_color = "#4a6cd4"  # Blue as primary color
-        self.accent_color = "#f25d50"   # Coral as accent
-        self.bg_color = "#f5f5f7"       # Light gray background
-        self.text_color = "#333333"     # Dark text
-        self.light_color = "#ffffff"    # White
+        # Without a window the pipeline runs headless, e.g. to profile a replay
+        self.headless = window is None
+        if not self.headless:
+            self.window.title(window_title)
+            self.window.geometry("1200x700")
+        
+        # Settings from the config file, reloaded while the app runs
+        self.settings = settings or AppConfig()
+        
+        # Skip detection on static scenes
+        self.motion_gate = MotionGate()
+        
+        # Keep per-frame processing within the latency and CPU budget
+        self.governor = FrameRateGovernor()
+        
+        # Grayscale, display and capture buffers reused by the video thread
+        self.frame_buffers = FrameBufferPool()
+        self.display_buffer = None
+        self.display_image = None
+        self.photo = None
+        
+        # Webhook, socket and JSONL capture events
+        self.notifier = Notifier()
+        
+        # Emails go out on a worker; anything unsent at exit is spooled to disk
+        self.spool = NotificationSpool()
+        self.email_worker = EmailWorker(self.send_email_with_image, self.spool)
+        for sink in self.notifier.sinks:
+            sink.spool = lambda name, events: self.spool.save("event", {"sink": name, "events": events})
+        
+        # Size-limited email attachments
+        self.attachment_encoder = AttachmentEncoder()
+        
+        # Full-frame or face-crop capture storage with sidecars
+        self.capture_store = CaptureStore()
+        self.last_detect_scale = 1.0
+        
+        # Searchable metadata of every capture
+        self.capture_index = CaptureIndex(self.capture_store)
+        self.gallery_filter = None
+        self.gallery_generation = 0
+        self.gallery_headers = []
+        
+        # Bulk delete, export and email run one at a time on a worker thread
+        self.bulk_cancel = None
+        self.bulk_thread = None
+        
+        # Colors, email, capture and detection settings
+        self.auto_capture_mode = self.settings.get("capture")["auto_capture"]
+        self.configured_auto_capture = self.auto_capture_mode
+        self.apply_settings(self.settings.values)
         
         # Configure window style
-        self.window.configure(bg=self.bg_color)
+        if not self.headless:
+            self.window.configure(bg=self.bg_color)
         
-        # Pre-configured email settings
-        self.email_recipient = "developer1@gmail.com"
-        self.email_sender = "developer1@gmail.com"
-        self.email_password = "dwkr lahn knxn yjve"
-        self.email_server = "smtp.gmail.com"
-        self.email_port = 587
-        self.auto_email = True  # Auto-email is enabled by default
+        # Memory and disk budgets
+        self.thumbnail_cache = ThumbnailCache(on_evict=self.on_thumbnail_evicted)
+        self.gallery_labels = {}
+        self.retention = RetentionPolicy(self.capture_store.directory)
+        self.retention_wakeup = threading.Event()
         
-        # Auto-capture mode (default to Auto)
-        self.auto_capture_mode = True
+        # Short clips around smile events
+        clips = self.settings.get("clips")
+        self.clip_recorder = (EventClipRecorder(self.capture_store.directory, clips["pre_roll"], clips["post_roll"],
+                                                clips["max_length"]) if clips["enabled"] else None)
+        
+        # Group captures by person in the background
+        identity = self.settings.get("identity")
+        self.identity_clusterer = (IdentityClusterer(self.capture_store, self.capture_index,
+                                                     identity["match_threshold"])
+                                   if identity["enabled"] else None)
+        # Cluster on clean pixels rather than the saved frame with its overlays
+        self.capture_store.crop_faces = identity["enabled"]
+        
+        # Open all capture sources - they reconnect on their own
+        if capture is None:
+            self.capture_manager = CaptureManager(CAMERA_SOURCES, CAMERA_STAND_INS)
+            self.cap = self.capture_manager.primary
+        else:
+            # A replay source paces itself and keeps the pipeline deterministic
+            self.capture_manager = CaptureManager([])
+            self.cap = capture
+            self.governor.enabled = False
+        self.frames_processed = 0
+        
+        # Drains every stage on exit
+        self.lifecycle = LifecycleManager()
+        
+        # Started once the camera delivers frames
+        self.preview_port = preview_port
+        self.preview_host = preview_host
+        self.preview_server = None
+        self.captured_images = []
+        self.gallery_trimmed = False
+        self.captures_taken = 0
+        self.is_capturing = False
         
         # Check if camera is available
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            self.show_camera_error()
+        if not self.cap.wait_until_connected(CAMERA_CONNECT_TIMEOUT):
+            if self.headless:
+                print("Error: capture source not available")
+            else:
+                self.show_camera_error()
             return
-            
+        
+        self.start_pipeline()
+    
+    def start_pipeline(self):
+        """Start the workers and the UI once the capture source is connected"""
         self.is_capturing = True
         
+        # Pick up config file changes without restarting the camera
+        self.settings.watch(self.on_settings_changed)
+        
+        # Prune old captures in the background
+        self.retention_thread = threading.Thread(target=self.run_retention, daemon=True)
+        self.retention_thread.start()
+        
+        # Optional remote preview of the annotated feed
+        if self.preview_port:
+            try:
+                self.preview_server = PreviewServer(self.preview_port, self.preview_host)
+            except OSError as e:
+                print(f"Error starting preview server: {e}")
+        
+        # Resend what was left over from the last run
+        self.resume_spool()
+        
+        # Headless runs call update() directly and have no UI
+        if self.headless:
+            self.register_stages()
+            return
+        
         # Configure modern styles
         self.configure_styles()
         
@@ -80,9 +2609,140 @@ class FaceDetectionApp:
         self.captured_images = []
         self.load_existing_images()
         
+        # Report memory and disk usage periodically
+        self.update_memory_report()
+        
+        # Order in which the stages are drained on exit
+        self.register_stages()
+        
         # Update the window
         self.window.protocol("WM_DELETE_WINDOW", self.on_closing)
     
+    def register_stages(self):
+        """Register the pipeline stages with the lifecycle manager, upstream first"""
+        def join(thread):
+            def close(timeout):
+                if thread is not None:
+                    thread.join(timeout)
+                    return not thread.is_alive()
+                return True
+            return close
+        
+        def stop_detector():
+            self.is_capturing = False
+            self.retention_wakeup.set()
+        
+        self.lifecycle.register("detector", stop_detector, join(getattr(self, "video_thread", None)))
+        self.lifecycle.register("grabber", None, self.release_sources)
+        if self.clip_recorder:
+            self.lifecycle.register("clip writer", None, self.clip_recorder.close)
+        self.lifecycle.register("bulk job", self.cancel_bulk_job,
+                                lambda timeout: join(self.bulk_thread)(timeout))
+        self.lifecycle.register("emailer", None, self.email_worker.close)
+        self.lifecycle.register("notifier", None, self.notifier.close)
+        if not self.headless:
+            self.lifecycle.register("gallery loader", self.gallery_loader_stop.set, join(self.gallery_loader))
+        self.lifecycle.register("retention", None, join(self.retention_thread))
+        if self.preview_server:
+            self.lifecycle.register("preview server", None, lambda timeout: self.preview_server.stop())
+        self.lifecycle.register("config watcher", None, lambda timeout: self.settings.stop())
+        if self.identity_clusterer:
+            self.lifecycle.register("identity clusterer", None, self.identity_clusterer.close)
+        self.lifecycle.register("index", None, lambda timeout: self.capture_index.close())
+    
+    def release_sources(self, timeout):
+        """Release the capture sources and the active capture"""
+        released = self.capture_manager.release(timeout)
+        self.cap.release()
+        return released
+    
+    def resume_spool(self):
+        """Resubmit the emails and events spooled by the previous run"""
+        email_configured = self.email_recipient and self.email_sender and self.email_password
+        resumed = 0
+        for path, kind, payload in self.spool.pending():
+            if kind == "email":
+                if not email_configured:
+                    # Keep them until email is set up
+                    continue
+                if os.path.exists(payload["image_path"]):
+                    self.email_worker.submit(payload["image_path"])
+            elif kind == "event":
+                sink = self.notifier.sink(payload["sink"])
+                if sink is None:
+                    continue
+                for event in payload["events"]:
+                    sink.emit(event)
+            self.spool.remove(path)
+            resumed += 1
+        if resumed:
+            print(f"Resumed {resumed} spooled notifications")
+    
+    def apply_settings(self, settings):
+        """Apply config values to the running pipeline without reopening the camera"""
+        # Theme and overlay colors
+        colors = settings["colors"]
+        self.primary_color = colors["primary"]
+        self.accent_color = colors["accent"]
+        self.bg_color = colors["background"]
+        self.text_color = colors["text"]
+        self.light_color = colors["light"]
+        self.face_box_color = tuple(colors["face_box"])
+        self.smile_color = tuple(colors["smile"])
+        self.no_smile_color = tuple(colors["no_smile"])
+        self.label_background_color = tuple(colors["label_background"])
+        
+        # Email settings
+        email = settings["email"]
+        self.email_recipient = email["recipient"]
+        self.email_sender = email["sender"]
+        self.email_password = email["password"]
+        self.email_server = email["server"]
+        self.email_port = email["port"]
+        self.auto_email = email["auto_email"]
+        
+        # Capture and storage settings - new captures go to the new directory
+        capture = settings["capture"]
+        self.capture_delay = capture["delay"]
+        self.capture_store.directory = capture["save_directory"]
+        self.capture_store.mode = capture["storage_mode"]
+        self.capture_store.context_scale = capture["context_scale"]
+        os.makedirs(self.capture_store.directory, exist_ok=True)
+        if hasattr(self, "retention"):
+            self.retention.directory = self.capture_store.directory
+        if getattr(self, "clip_recorder", None):
+            self.clip_recorder.directory = self.capture_store.directory
+            self.clip_recorder.pre_roll = settings["clips"]["pre_roll"]
+            self.clip_recorder.post_roll = settings["clips"]["post_roll"]
+            self.clip_recorder.max_length = settings["clips"]["max_length"]
+        if getattr(self, "identity_clusterer", None):
+            self.identity_clusterer.threshold = settings["identity"]["match_threshold"]
+        
+        # Detection, motion gate and governor settings
+        set_detection_params(settings["detection"]["face"], settings["detection"]["smile"])
+        for key in DEFAULT_CONFIG["motion"]:
+            setattr(self.motion_gate, key, settings["motion"][key])
+        self.governor.target_latency = settings["governor"]["target_latency"]
+        self.governor.cpu_target = settings["governor"]["cpu_target"]
+    
+    def on_settings_changed(self, settings):
+        """Called from the config watcher thread when the file changes"""
+        self.apply_settings(settings)
+        if not self.headless:
+            self.window.after(0, lambda: self.refresh_settings_ui(settings))
+    
+    def refresh_settings_ui(self, settings):
+        """Update widgets affected by reloaded settings, leaving the gallery as it is"""
+        self.window.configure(bg=self.bg_color)
+        self.configure_styles()
+        self.email_status.config(text=f"Email: {self.email_recipient}")
+        # Only a changed auto_capture setting overrides the mode chosen with the button
+        auto_capture = settings["capture"]["auto_capture"]
+        if auto_capture != self.configured_auto_capture:
+            self.configured_auto_capture = auto_capture
+            if auto_capture != self.auto_capture_mode:
+                self.toggle_capture_mode()
+    
     def configure_styles(self):
         """Configure custom styles for the app"""
         style = ttk.Style()
@@ -156,23 +2816,14 @@ class FaceDetectionApp:
     
     def retry_camera_connection(self):
         """Try to reconnect to the camera"""
-        if self.cap.isOpened():
-            self.cap.release()
-            
-        self.cap = cv2.VideoCapture(0)
-        
-        if self.cap.isOpened():
+        # The source keeps reconnecting in the background - just wait for a frame
+        if self.cap.wait_until_connected(CAMERA_CONNECT_TIMEOUT):
             # Clear the window
             for widget in self.window.winfo_children():
                 widget.destroy()
                 
-            # Restart the app components
-            self.is_capturing = True
-            self.create_ui()
-            self.video_thread = threading.Thread(target=self.update, daemon=True)
-            self.video_thread.start()
-            self.captured_images = []
-            self.load_existing_images()
+            # Start everything that was skipped while the camera was missing
+            self.start_pipeline()
         else:
             # Update error message
             error_label = ttk.Label(
@@ -260,6 +2911,7 @@ class FaceDetectionApp:
         # Video display label
         self.video_label = ttk.Label(video_container, image=self.placeholder_photo, borderwidth=2, relief="solid")
         self.video_label.pack()
+        self.photo = None  # Created from the first frame, then updated in place
         
         # Mode display frame
         mode_frame = ttk.Frame(self.left_frame, style="Light.TFrame")
@@ -278,7 +2930,42 @@ class FaceDetectionApp:
             foreground="#008800",
             style="Status.TLabel"
         )
-        self.status_label.pack(side=tk.LEFT, padx=5)
+        self.status_label.pack(side=tk.LEFT, padx=5)
+        
+        # Motion gate and governor statistics
+        self.stats_label = ttk.Label(
+            mode_frame,
+            text="Motion gate: 0% frames skipped",
+            font=("Segoe UI", 9),
+            foreground="#666666",
+            style="Status.TLabel"
+        )
+        self.stats_label.pack(side=tk.RIGHT, padx=5)
+        
+        # Capture source selection and health
+        source_frame = ttk.Frame(self.left_frame, style="Light.TFrame")
+        source_frame.pack(fill=tk.X, padx=15, pady=(0, 10))
+        
+        if len(self.capture_manager.sources) > 1:
+            self.source_var = tk.StringVar(value=self.cap.name)
+            source_select = ttk.Combobox(
+                source_frame,
+                textvariable=self.source_var,
+                values=list(self.capture_manager.sources),
+                state="readonly",
+                width=24
+            )
+            source_select.bind("<<ComboboxSelected>>", lambda e: self.select_source(self.source_var.get()))
+            source_select.pack(side=tk.LEFT, padx=5)
+        
+        self.source_label = ttk.Label(
+            source_frame,
+            text="",
+            font=("Segoe UI", 9),
+            foreground="#666666",
+            style="Status.TLabel"
+        )
+        self.source_label.pack(side=tk.LEFT, padx=5)
         
         # Control panel with gradient background
         control_panel = ttk.Frame(self.left_frame, style="Light.TFrame")
@@ -363,6 +3050,80 @@ class FaceDetectionApp:
         )
         self.gallery_count.pack(side=tk.LEFT)
         
+        # Memory and disk usage against the configured budgets
+        self.memory_label = ttk.Label(
+            gallery_header,
+            text="",
+            font=("Segoe UI", 8),
+            style="Gallery.TLabel"
+        )
+        self.memory_label.pack(side=tk.RIGHT)
+        
+        # Search by date range, smile state and number of faces
+        filter_frame = ttk.Frame(self.canvas_frame, style="Light.TFrame")
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.filter_from_var = tk.StringVar()
+        self.filter_to_var = tk.StringVar()
+        self.filter_smile_var = tk.StringVar(value="Any")
+        self.filter_faces_var = tk.StringVar(value="0")
+        
+        ttk.Label(filter_frame, text="From", style="Gallery.TLabel").pack(side=tk.LEFT)
+        from_entry = ttk.Entry(filter_frame, textvariable=self.filter_from_var, width=11)
+        from_entry.pack(side=tk.LEFT, padx=(3, 8))
+        
+        ttk.Label(filter_frame, text="To", style="Gallery.TLabel").pack(side=tk.LEFT)
+        to_entry = ttk.Entry(filter_frame, textvariable=self.filter_to_var, width=11)
+        to_entry.pack(side=tk.LEFT, padx=(3, 8))
+        
+        smile_select = ttk.Combobox(
+            filter_frame,
+            textvariable=self.filter_smile_var,
+            values=["Any", "Smiling", "Not smiling"],
+            state="readonly",
+            width=11
+        )
+        smile_select.pack(side=tk.LEFT, padx=(0, 8))
+        
+        ttk.Label(filter_frame, text="Min faces", style="Gallery.TLabel").pack(side=tk.LEFT)
+        faces_spin = ttk.Spinbox(filter_frame, textvariable=self.filter_faces_var, from_=0, to=20, width=3)
+        faces_spin.pack(side=tk.LEFT, padx=(3, 8))
+        
+        ttk.Button(filter_frame, text="🔍 Search", command=self.apply_gallery_filter).pack(side=tk.LEFT, padx=2)
+        ttk.Button(filter_frame, text="Clear", command=self.clear_gallery_filter).pack(side=tk.LEFT, padx=2)
+        
+        self.group_by_person_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filter_frame, text="Group by person", variable=self.group_by_person_var,
+                        command=self.toggle_person_groups).pack(side=tk.LEFT, padx=(8, 0))
+        for entry in (from_entry, to_entry, faces_spin):
+            entry.bind("<Return>", lambda e: self.apply_gallery_filter())
+        
+        # Actions on the selected captures
+        bulk_frame = ttk.Frame(self.canvas_frame, style="Light.TFrame")
+        bulk_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Button(bulk_frame, text="Select all", command=lambda: self.select_all_images(True)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(bulk_frame, text="None", command=lambda: self.select_all_images(False)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(bulk_frame, text="🗑️ Delete", style="Accent.TButton",
+                   command=self.delete_selected_images).pack(side=tk.LEFT, padx=2)
+        ttk.Button(bulk_frame, text="📦 Export", command=self.export_selected_images).pack(side=tk.LEFT, padx=2)
+        ttk.Button(bulk_frame, text="📧 Email", command=self.email_selected_images).pack(side=tk.LEFT, padx=2)
+        
+        self.selection_label = ttk.Label(bulk_frame, text="0 selected", style="Gallery.TLabel")
+        self.selection_label.pack(side=tk.LEFT, padx=8)
+        
+        # Progress of the running bulk job, shown only while it runs
+        self.bulk_job_frame = ttk.Frame(self.canvas_frame, style="Light.TFrame")
+        self.bulk_status = ttk.Label(self.bulk_job_frame, text="", style="Gallery.TLabel")
+        self.bulk_status.pack(side=tk.LEFT)
+        self.bulk_progress = ttk.Progressbar(self.bulk_job_frame, mode="determinate", length=200)
+        self.bulk_progress.pack(side=tk.LEFT, padx=8, fill=tk.X, expand=True)
+        ttk.Button(self.bulk_job_frame, text="Cancel", command=self.cancel_bulk_job).pack(side=tk.LEFT)
+        self.bulk_job_anchor = bulk_frame
+        
+        # Placeholder shown for thumbnails that aren't resident
+        self.thumbnail_placeholder = tk.PhotoImage(width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1])
+        
         # Create a styled canvas for the gallery
         self.canvas = tk.Canvas(self.canvas_frame, bg=self.light_color, highlightthickness=0)
         scrollbar = ttk.Scrollbar(self.canvas_frame, orient="vertical", command=self.canvas.yview)
@@ -376,7 +3137,13 @@ class FaceDetectionApp:
         )
         
         self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
+        
+        # Load thumbnails as they scroll into view
+        def on_gallery_scroll(first, last):
+            scrollbar.set(first, last)
+            self.schedule_thumbnail_refresh()
+        self.canvas.configure(yscrollcommand=on_gallery_scroll)
+        self.thumbnail_refresh_pending = False
         
         self.canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -394,6 +3161,23 @@ class FaceDetectionApp:
         )
         footer_text.pack(side=tk.RIGHT)
     
+    def select_source(self, name):
+        """Switch the live view and detection to another capture source"""
+        capture = self.capture_manager.get(name)
+        if capture is not None:
+            self.cap = capture
+            self.show_notification("Source Changed", f"Now showing: {name}", duration=1500)
+    
+    def format_source_stats(self):
+        """Summarise health and frame rate of every capture source"""
+        parts = []
+        for stats in self.capture_manager.stats():
+            if stats["state"] in ("live", "stand-in"):
+                parts.append(f"{stats['name']}: {stats['state']} {stats['fps']:.1f} fps")
+            else:
+                parts.append(f"{stats['name']}: {stats['state']} ({stats['reconnects']} reconnects)")
+        return " | ".join(parts)
+    
     def toggle_capture_mode(self):
         """Toggle between auto-capture and manual capture modes with modern notification"""
         self.auto_capture_mode = not self.auto_capture_mode
@@ -416,6 +3200,10 @@ class FaceDetectionApp:
     
     def show_notification(self, title, message, duration=2000):
         """Show a modern floating notification"""
+        if self.headless:
+            print(f"{title}: {message}")
+            return
+        
         notification = tk.Toplevel(self.window)
         notification.title("")
         notification.geometry("320x100")
@@ -459,12 +3247,24 @@ class FaceDetectionApp:
         # Auto-close after duration
         notification.after(duration, notification.destroy)
     
+    def queue_email(self, image_path, cancel=None):
+        """Hand an image to the email worker; returns False when email is not configured or it wasn't queued"""
+        if not self.email_recipient or not self.email_sender or not self.email_password:
+            return False
+        return self.email_worker.submit(image_path, cancel)
+    
     def send_email_with_image(self, image_path):
         """Send an email with the captured image as an attachment with improved spam prevention"""
         if not self.email_recipient or not self.email_sender or not self.email_password:
             return False
         
         try:
+            # Re-encode the image to fit the size budget before connecting
+            img_data = self.attachment_encoder.encode(image_path, self.capture_store.boxes_for_image(image_path))
+            if img_data is None:
+                print(f"Error sending email: cannot read {image_path}")
+                return False
+            
             # Set up the SMTP server
             server = smtplib.SMTP(self.email_server, self.email_port)
             server.starttls()
@@ -479,37 +3279,9 @@ class FaceDetectionApp:
             # Message body - more professional content to avoid spam filters
             current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            # HTML Body with better formatting (helps avoid spam filters)
-            html_body = f"""
-            <html>
-            <body style="font-family: 'Segoe UI', Arial, sans-serif; color: #333333; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f5f5f7;">
-                <div style="background-color: #ffffff; border-radius: 8px; padding: 20px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                    <h2 style="color: #4a6cd4; margin-top: 0;">New Smile Detected! 😄</h2>
-                    <p>Hello,</p>
-                    <p>Your Smile Detection App has captured a new smile at <b>{current_time}</b>.</p>
-                    <p>The captured image is attached to this email.</p>
-                    <div style="margin: 20px 0; padding: 15px; background-color: #f0f4ff; border-left: 4px solid #4a6cd4; border-radius: 4px;">
-                        <p style="margin: 0; color: #555;">Smile Detection App is automatically capturing your best moments!</p>
-                    </div>
-                    <p>Best regards,<br>
-                    Your Smile Detection App</p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Plain text alternative
-            text_body = f"""
-            New Smile Detected!
-            
-            Hello,
-            
-            Your Smile Detection App has captured a new smile at {current_time}.
-            The captured image is attached to this email.
-            
-            Best regards,
-            Your Smile Detection App
-            """
+            # Fill in the prebuilt HTML and plain text bodies
+            html_body = EMAIL_HTML_TEMPLATE.format(current_time=current_time)
+            text_body = EMAIL_TEXT_TEMPLATE.format(current_time=current_time)
             
             # Add plain text part
             msg.attach(MIMEText(text_body, 'plain'))
@@ -523,12 +3295,10 @@ class FaceDetectionApp:
             msg.add_header('X-Mailer', 'Microsoft Outlook')
             msg.add_header('Importance', 'High')
             
-            # Attach image
-            with open(image_path, 'rb') as img_file:
-                img_data = img_file.read()
-                image = MIMEImage(img_data, name=os.path.basename(image_path))
-                image.add_header('Content-Disposition', f'attachment; filename="{os.path.basename(image_path)}"')
-                msg.attach(image)
+            # Attach the re-encoded image
+            image = MIMEImage(img_data, _subtype="jpeg", name=os.path.basename(image_path))
+            image.add_header('Content-Disposition', f'attachment; filename="{os.path.basename(image_path)}"')
+            msg.attach(image)
             
             # Send the email
             server.send_message(msg)
@@ -540,84 +3310,193 @@ class FaceDetectionApp:
             return False
     
     def update(self):
-        # Variables to track face detection and capture timing
-        last_capture_time = 0
-        capture_delay = 2  # Delay between captures in seconds
+        # Variables to track face detection and capture timing - the first face is always captured
+        last_capture_time = None
         error_count = 0
         max_errors = 5
         
+        # Last detection result, reused while the scene is static
+        detections = []
+        last_stats_time = 0
+        last_stats_frames = 0
+        last_stats_allocations = 0
+        last_stats_copies = 0
+        
         while self.is_capturing:
             try:
+                # Pace the loop and keep the camera settings in line with the governor
+                self.governor.wait_for_next_frame()
+                self.governor.apply_to_camera(self.cap)
+                
                 ret, frame = self.cap.read()
                 if not ret:
-                    error_count += 1
-                    if error_count > max_errors:
-                        print("Too many frame errors. Camera may be disconnected.")
+                    # Stop only when the source was released - otherwise it is reconnecting
+                    if not self.cap.isOpened():
                         break
+                    error_count += 1
+                    if error_count == max_errors:
+                        print("Too many frame errors. Camera may be disconnected, reconnecting...")
+                    if error_count >= max_errors and not self.headless:
+                        self.source_label.config(text=self.format_source_stats())
                     time.sleep(0.1)
                     continue
                 
                 # Reset error count on successful frame
                 error_count = 0
+                frame_start = time.time()
+                self.frames_processed += 1
+                
+                # Frame time from the source - the original timeline for replays
+                current_time = self.cap.timestamp
+                
+                # Only run the cascades when due and something in the view has changed
+                if self.governor.should_detect() and self.motion_gate.should_detect(frame, current_time):
+                    scale = self.governor.scale_for((frame.shape[1], frame.shape[0]))
+                    detections = self.detect_faces_and_smiles(frame, scale, self.frame_buffers)
+                
+                # Keep a clean copy for face crops before the overlays are drawn - saved before the next frame
+                capture_due = (self.auto_capture_mode and len(detections) > 0 and
+                               (last_capture_time is None or current_time - last_capture_time > self.capture_delay))
+                raw_frame = None
+                if capture_due and self.capture_store.needs_raw_frame:
+                    raw_frame = self.frame_buffers.copy("raw", frame)
                 
-                # Apply facial attribute detection and check if faces were detected
-                result, face_detected, is_smiling = self.detect_facial_attributes(frame)
+                # Draw the detection result and check if faces were detected
+                result, face_detected, is_smiling = self.draw_facial_attributes(frame, detections)
+                
+                # Stream the annotated frame to remote viewers
+                if self.preview_server:
+                    self.preview_server.publish(result)
+                
+                # Feed the clip recorder; encoding happens on its own threads
+                if self.clip_recorder:
+                    self.clip_recorder.push(result, current_time)
+                    if is_smiling:
+                        self.clip_recorder.trigger(current_time)
                 
                 # Auto-capture logic - capture any face detected
-                current_time = time.time()
-                if self.auto_capture_mode and face_detected and current_time - last_capture_time > capture_delay:
+                if capture_due:
                     # Capture image whenever a face is detected
-                    self.capture_image(result)
+                    self.capture_image(result, detections, raw_frame)
                     last_capture_time = current_time
                 
-                # Convert to RGB for tkinter
-                cv_image = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
+                if not self.headless:
+                    self.show_frame(result)
                 
-                # Convert to PhotoImage
-                img = Image.fromarray(cv_image)
-                img = img.resize((640, 480), Image.LANCZOS)
-                self.photo = ImageTk.PhotoImage(image=img)
+                # Let the governor adjust to the time this frame took
+                self.governor.record(time.time() - frame_start)
                 
-                # Update video label
-                self.video_label.config(image=self.photo)
-                self.video_label.image = self.photo
+                # Report motion gate and governor statistics
+                if not self.headless and current_time - last_stats_time > 1.0:
+                    frames = max(1, self.frames_processed - last_stats_frames)
+                    self.stats_label.config(
+                        text=f"Motion gate: {self.motion_gate.skipped_percent:.0f}% frames skipped | "
+                             f"{self.governor.frame_rate} fps, detect 1/{self.governor.detect_interval} "
+                             f"at {self.governor.detect_scale:.0%} | "
+                             f"Buffers: {self.frame_buffers.allocations - last_stats_allocations} allocs, "
+                             f"{(self.frame_buffers.copies - last_stats_copies) / frames:.1f} copies/frame"
+                    )
+                    last_stats_frames = self.frames_processed
+                    last_stats_allocations = self.frame_buffers.allocations
+                    last_stats_copies = self.frame_buffers.copies
+                    self.source_label.config(text=self.format_source_stats())
+                    last_stats_time = current_time
+                
+                # Drop to a low polling rate once the scene has been static for a while
+                if self.governor.enabled and self.motion_gate.is_idle:
+                    time.sleep(self.motion_gate.idle_interval)
                 
             except Exception as e:
                 print(f"Error in video processing: {e}")
                 time.sleep(0.1)
         
+    def show_frame(self, frame):
+        """Show a frame in the video label, reusing the conversion buffers and the PhotoImage"""
+        width, height = 640, 480
+        if frame.shape[:2] != (height, width):
+            display = self.frame_buffers.get("display", (height, width, 3))
+            frame = cv2.resize(frame, (width, height), dst=display, interpolation=cv2.INTER_AREA)
+        rgba = self.frame_buffers.get("rgba", (height, width, 4))
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=rgba)
+        
+        # PIL image sharing the buffer's memory, recreated only with the buffer
+        if self.display_buffer is not rgba:
+            self.display_buffer = rgba
+            self.display_image = Image.frombuffer("RGBA", (width, height), rgba, "raw", "RGBA", 0, 1)
+        
+        # Copy into the existing PhotoImage instead of creating one per frame
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(image=self.display_image)
+            self.video_label.config(image=self.photo)
+            self.video_label.image = self.photo
+        else:
+            self.photo.paste(self.display_image)
+        self.frame_buffers.copies += 1
+    
     def detect_facial_attributes(self, frame):
+        """Detect faces and smiles in the frame and draw the result on it"""
+        return self.draw_facial_attributes(frame, self.detect_faces_and_smiles(frame))
+    
+    def detect_faces_and_smiles(self, frame, scale=1.0, buffers=None):
+        """Run the cascades and return a list of (face, smiles) tuples
+        
+        With a FrameBufferPool the grayscale images are written into its buffers; the pool
+        must only be used by one thread.
+        """
+        height, width = frame.shape[:2]
+        
         # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = buffers.get("gray", (height, width)) if buffers else None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
         
-        # Flag to track if faces are detected
-        face_detected = False
-        is_smiling = False
+        # Search for faces on a smaller image when a scale is given
+        if scale < 1.0:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            search = buffers.get("search", (size[1], size[0])) if buffers else None
+            search = cv2.resize(gray, size, dst=search, interpolation=cv2.INTER_AREA)
+        else:
+            search = gray
+        
+        # Remember the scale so captures can record how they were detected
+        self.last_detect_scale = scale
         
         # Detect faces - improved parameters for better distance detection
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=4,  # Reduced for better detection
-            minSize=(20, 20)  # Smaller minimum size to detect faces from a distance
-        )
+        faces = face_cascade.detectMultiScale(search, **FACE_DETECTION_PARAMS)
         
-        # For each face, detect smiles only
+        detections = []
         for (x, y, w, h) in faces:
+            # Map the face back to full resolution
+            if scale < 1.0:
+                x, y, w, h = (int(v / scale) for v in (x, y, w, h))
+            
+            # Detect smiles within the face
+            roi_gray = gray[y:y+h, x:x+w]
+            smiles = smile_cascade.detectMultiScale(roi_gray, **SMILE_DETECTION_PARAMS)
+            detections.append(((x, y, w, h), smiles))
+        
+        return detections
+    
+    def draw_facial_attributes(self, frame, detections):
+        """Draw face boxes and smile labels for the given detections"""
+        # Flag to track if faces are detected
+        face_detected = False
+        is_smiling = False
+        
+        # For each face, draw the smile status
+        for (x, y, w, h), smiles in detections:
             # Mark that we've detected a face
             face_detected = True
             
             # Extract face region
-            roi_gray = gray[y:y+h, x:x+w]
             roi_color = frame[y:y+h, x:x+w]
             
             # Draw face rectangle with modern design (rounded corners effect)
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (74, 108, 212), 3, cv2.LINE_AA)
+            cv2.rectangle(frame, (x, y), (x+w, y+h), self.face_box_color, 3, cv2.LINE_AA)
             
             # Draw corner markers for a more modern look
             corner_length = 20  # Length of corner marker
             thickness = 3       # Thickness of corner marker
-            color = (74, 108, 212)  # Primary color
+            color = self.face_box_color  # Primary color
             
             # Top-left corner
             cv2.line(frame, (x, y), (x + corner_length, y), color, thickness, cv2.LINE_AA)
@@ -635,26 +3514,18 @@ class FaceDetectionApp:
             cv2.line(frame, (x + w, y + h), (x + w - corner_length, y + h), color, thickness, cv2.LINE_AA)
             cv2.line(frame, (x + w, y + h), (x + w, y + h - corner_length), color, thickness, cv2.LINE_AA)
             
-            # Detect smiles within the face
-            smiles = smile_cascade.detectMultiScale(
-                roi_gray,
-                scaleFactor=1.3,
-                minNeighbors=10,
-                minSize=(15, 15)
-            )
-            
             # Determine smile status
             if len(smiles) > 0:
                 is_smiling = True
                 smile_message = "SMILE DETECTED"
-                smile_color = (0, 255, 0)  # Green color
+                smile_color = self.smile_color  # Green color
                 
                 # Draw smile rectangles
                 for (sx, sy, sw, sh) in smiles:
-                    cv2.rectangle(roi_color, (sx, sy), (sx+sw, sy+sh), (0, 255, 0), 2, cv2.LINE_AA)
+                    cv2.rectangle(roi_color, (sx, sy), (sx+sw, sy+sh), self.smile_color, 2, cv2.LINE_AA)
             else:
                 smile_message = "NO SMILE"
-                smile_color = (0, 0, 255)  # Red color
+                smile_color = self.no_smile_color  # Red color
             
             # Create a more modern label with rounded rectangle background
             text_size = cv2.getTextSize(smile_message, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
@@ -672,15 +3543,14 @@ class FaceDetectionApp:
             bg_y1 = text_y - text_size[1] - pill_padding // 2
             bg_y2 = text_y + pill_padding // 2
             
-            # Draw background with rounded corners effect
-            overlay = frame.copy()
-            # Filled rectangle
-            cv2.rectangle(overlay, (bg_x1, bg_y1), (bg_x2, bg_y2), 
-                         (30, 30, 30), -1, cv2.LINE_AA)
-                         
-            # Apply overlay with transparency
+            # Blend the label background into the frame in place, clipped to the frame
             alpha = 0.7
-            cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+            frame_height, frame_width = frame.shape[:2]
+            roi = frame[max(0, bg_y1):min(frame_height, bg_y2 + 1), max(0, bg_x1):min(frame_width, bg_x2 + 1)]
+            if roi.size:
+                background = tuple(channel * alpha for channel in self.label_background_color) + (0,)
+                cv2.convertScaleAbs(roi, dst=roi, alpha=1 - alpha)
+                cv2.add(roi, background, dst=roi)
             
             # Draw the smile text
             cv2.putText(frame, smile_message, (text_x, text_y), 
@@ -688,7 +3558,7 @@ class FaceDetectionApp:
         
         return frame, face_detected, is_smiling
     
-    def capture_image(self, frame=None):
+    def capture_image(self, frame=None, detections=None, raw_frame=None):
         """Capture the current frame and save it with enhanced styling"""
         if frame is None:
             # Get current frame if not provided
@@ -696,58 +3566,72 @@ class FaceDetectionApp:
             if not ret:
                 return
             # Apply detection before saving
-            result, _, _ = self.detect_facial_attributes(frame)
+            detections = self.detect_faces_and_smiles(frame)
+            raw_frame = frame.copy() if self.capture_store.needs_raw_frame else None
+            result, _, _ = self.draw_facial_attributes(frame, detections)
         else:
             result = frame
-            
-        # Generate filename with timestamp
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{SAVE_DIRECTORY}/face_{timestamp}.jpg"
+        detections = detections or []
+        
+        # Save the capture and its sidecar
+        capture_id, filename = self.capture_store.save(result, detections, raw_frame, self.last_detect_scale)
+        if filename is None:
+            # Face-crop mode without faces and without a context frame
+            return
         
-        # Save image
-        cv2.imwrite(filename, result)
+        # Let the retention policy account for the new files
+        self.captures_taken += 1
+        self.retention_wakeup.set()
+        self.capture_index.add(capture_id)
+        if self.identity_clusterer:
+            self.identity_clusterer.submit(capture_id)
         
-        # Add to gallery
-        self.add_image_to_gallery(filename)
+        # Notify downstream systems without waiting for email
+        if self.notifier.sinks:
+            self.notifier.publish(build_capture_event(capture_id, time.time(), detections, result))
         
-        # Update gallery count
-        if hasattr(self, 'gallery_count'):
-            self.gallery_count.config(text=f"Captured images: {len(self.captured_images)}")
+        # Add to gallery unless it is filtered out - the grouped view is refreshed when toggled
+        if self.headless or not self.group_by_person_var.get():
+            if self.gallery_filter is None or self.capture_index.search(capture_id=capture_id, **self.gallery_filter):
+                self.add_image_to_gallery(filename)
         
-        # Send email when auto_email is on
-        email_sent = False
+        # Queue the email when auto_email is on - it is sent in the background
+        email_queued = False
         if self.auto_email:
-            email_sent = self.send_email_with_image(filename)
+            email_queued = self.queue_email(filename)
         
         # Show sleek notification with custom styling
         if self.auto_capture_mode:
-            if email_sent:
+            if email_queued:
                 title = "Auto-Capture Success"
-                message = "Image auto-captured and sent by email"
+                message = "Image auto-captured and queued for email"
             else:
                 title = "Auto-Capture Success"
                 message = "Image automatically captured and saved"
         else:
-            if email_sent:
+            if email_queued:
                 title = "Manual Capture"
-                message = "Image captured and sent by email"
+                message = "Image captured and queued for email"
             else:
                 title = "Manual Capture"
                 message = "Image captured and saved successfully"
                 
         self.show_notification(title, message)
     
-    def add_image_to_gallery(self, image_path):
+    def add_image_to_gallery(self, image_path, lazy=False):
         """Add an image to the gallery with enhanced modern styling"""
+        if self.headless:
+            self.captured_images.append({"path": image_path, "frame": None})
+            self.trim_gallery()
+            return
+        
         try:
             # Create a frame for this image with shadow effect
             img_frame = ttk.Frame(self.scrollable_frame, style="Gallery.TFrame")
             img_frame.pack(fill=tk.X, padx=10, pady=10)
             
-            # Load and resize image
-            img = Image.open(image_path)
-            img = img.resize((200, 160), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
+            # Load the thumbnail now, or when it scrolls into view
+            photo = self.thumbnail_placeholder if lazy else self.thumbnail_cache.get(image_path)
             
             # Get image timestamp and format it nicely
             timestamp_parts = os.path.basename(image_path).split('_')[1].split('.')[0]
@@ -775,6 +3659,7 @@ class FaceDetectionApp:
             img_label = ttk.Label(img_outer, image=photo, borderwidth=1, relief="solid")
             img_label.image = photo  # Keep a reference
             img_label.pack()
+            self.gallery_labels.setdefault(image_path, []).append(img_label)
             
             # Create info panel with elegant styling
             info_frame = ttk.Frame(content_frame, style="Light.TFrame")
@@ -812,7 +3697,7 @@ class FaceDetectionApp:
             
             # Email button with icon
             email_btn = ttk.Button(actions_frame, text="📧 Email", width=10,
-                                command=lambda path=image_path: self.send_email_with_image(path))
+                                command=lambda path=image_path: self.queue_email(path))
             email_btn.pack(side=tk.LEFT, padx=5)
             
             # Delete button with icon and accent style
@@ -820,8 +3705,17 @@ class FaceDetectionApp:
                                    command=lambda path=image_path, frame=img_frame: self.delete_image(path, frame))
             delete_btn.pack(side=tk.LEFT, padx=5)
             
+            # Checkbox for bulk actions
+            selected = tk.BooleanVar(value=False)
+            select_check = ttk.Checkbutton(actions_frame, text="Select", variable=selected,
+                                           command=self.update_selection_count)
+            select_check.pack(side=tk.LEFT, padx=5)
+            
             # Store image info
-            self.captured_images.append({"path": image_path, "frame": img_frame})
+            self.captured_images.append({"path": image_path, "frame": img_frame, "label": img_label,
+                                         "selected": selected})
+            if not lazy:
+                self.trim_gallery()
             
             # Update scrollbar
             self.canvas.update_idletasks()
@@ -829,11 +3723,441 @@ class FaceDetectionApp:
             
             # Update gallery count
             if hasattr(self, 'gallery_count'):
-                self.gallery_count.config(text=f"Captured images: {len(self.captured_images)}")
+                self.update_gallery_count()
                 
         except Exception as e:
             print(f"Error adding image to gallery: {e}")
     
+    def trim_gallery(self):
+        """Drop the oldest gallery items beyond GALLERY_MAX_ITEMS; the files stay on disk and searchable"""
+        excess = len(self.captured_images) - GALLERY_MAX_ITEMS
+        if excess <= 0:
+            return
+        for entry in self.captured_images[:excess]:
+            if entry["frame"] is not None:
+                entry["frame"].destroy()
+            self.gallery_labels.pop(entry["path"], None)
+            self.thumbnail_cache.discard(entry["path"])
+        del self.captured_images[:excess]
+        self.gallery_trimmed = True
+    
+    def on_thumbnail_evicted(self, image_path):
+        """Release an evicted thumbnail by showing the placeholder instead"""
+        for label in self.gallery_labels.get(image_path, []):
+            if label.winfo_exists():
+                label.config(image=self.thumbnail_placeholder)
+                label.image = self.thumbnail_placeholder
+    
+    def schedule_thumbnail_refresh(self):
+        """Refresh visible thumbnails once the gallery has settled"""
+        if not self.thumbnail_refresh_pending:
+            self.thumbnail_refresh_pending = True
+            self.window.after(50, self.refresh_visible_thumbnails)
+    
+    def refresh_visible_thumbnails(self):
+        """Decode thumbnails of the gallery items that are currently visible"""
+        self.thumbnail_refresh_pending = False
+        total_height = self.scrollable_frame.winfo_height()
+        if total_height <= 1:
+            return
+        top, bottom = self.canvas.yview()
+        view_top = top * total_height
+        view_bottom = bottom * total_height
+        
+        for entry in self.captured_images:
+            frame = entry["frame"]
+            label = entry.get("label")
+            if frame is None or label is None or not frame.winfo_exists():
+                continue
+            item_top = frame.winfo_y()
+            if item_top + frame.winfo_height() < view_top or item_top > view_bottom:
+                continue
+            try:
+                photo = self.thumbnail_cache.get(entry["path"])
+            except Exception as e:
+                print(f"Error loading thumbnail: {e}")
+                continue
+            if label.image is not photo:
+                label.config(image=photo)
+                label.image = photo
+    
+    def remove_from_gallery(self, image_paths):
+        """Remove several images from the gallery with a single UI refresh"""
+        image_paths = set(image_paths)
+        for entry in self.captured_images:
+            if entry["path"] in image_paths and entry["frame"] is not None:
+                entry["frame"].destroy()
+        self.captured_images = [img for img in self.captured_images if img["path"] not in image_paths]
+        for path in image_paths:
+            self.gallery_labels.pop(path, None)
+            self.thumbnail_cache.discard(path)
+        self.capture_index.remove(image_paths)
+        
+        if self.headless:
+            return
+        self.canvas.update_idletasks()
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.update_gallery_count()
+        self.update_selection_count()
+        self.schedule_thumbnail_refresh()
+    
+    def update_gallery_count(self):
+        """Show how many captures the gallery lists"""
+        label = "Matching images" if self.gallery_filter else "Captured images"
+        shown = f" (newest {GALLERY_MAX_ITEMS} shown)" if self.gallery_trimmed else ""
+        self.gallery_count.config(text=f"{label}: {len(self.captured_images)}{shown}")
+    
+    def apply_gallery_filter(self):
+        """Show only the captures matching the search controls"""
+        try:
+            start = end = None
+            if self.filter_from_var.get().strip():
+                start = datetime.datetime.strptime(self.filter_from_var.get().strip(), "%Y-%m-%d")
+            if self.filter_to_var.get().strip():
+                # The end date is inclusive
+                end = datetime.datetime.strptime(self.filter_to_var.get().strip(), "%Y-%m-%d")
+                end += datetime.timedelta(days=1)
+            min_faces = int(self.filter_faces_var.get() or 0)
+        except ValueError:
+            self.show_notification("Invalid Search", "Use dates like 2024-01-31 and a whole number of faces")
+            return
+        
+        gallery_filter = {}
+        if start is not None:
+            gallery_filter["start"] = start.timestamp()
+        if end is not None:
+            gallery_filter["end"] = end.timestamp()
+        smile_state = self.filter_smile_var.get()
+        if smile_state != "Any":
+            gallery_filter["smiling"] = smile_state == "Smiling"
+        if min_faces > 0:
+            gallery_filter["min_faces"] = min_faces
+        self.show_gallery(gallery_filter or None)
+    
+    def clear_gallery_filter(self):
+        """Reset the search controls and list every capture again"""
+        self.filter_from_var.set("")
+        self.filter_to_var.set("")
+        self.filter_smile_var.set("Any")
+        self.filter_faces_var.set("0")
+        self.show_gallery(None)
+    
+    def add_person_header(self, person, count):
+        """Heading above the captures of one person in the grouped view"""
+        text = f"👤 Person {person}" if person is not None else "Not grouped yet"
+        header = ttk.Label(
+            self.scrollable_frame,
+            text=f"{text} ({count} {'capture' if count == 1 else 'captures'})",
+            font=("Segoe UI", 11, "bold"),
+            style="Gallery.TLabel"
+        )
+        header.pack(fill=tk.X, padx=10, pady=(15, 0))
+        self.gallery_headers.append(header)
+    
+    def toggle_person_groups(self):
+        """Switch between the timeline and the captures grouped by person"""
+        if self.group_by_person_var.get() and self.identity_clusterer is None:
+            self.show_notification("Identity Clustering Off",
+                                   "Set identity.enabled in the settings file and restart to group new captures by person")
+        self.show_gallery(self.gallery_filter)
+    
+    def show_gallery(self, gallery_filter):
+        """Rebuild the gallery from the index; thumbnails still load only once visible"""
+        self.gallery_filter = gallery_filter
+        if self.group_by_person_var.get():
+            # A header before the captures of each person
+            matches = self.capture_index.search_by_person(**(gallery_filter or {}))
+            # Keep the newest captures within the gallery limit, still grouped by person
+            trimmed = len(matches) > GALLERY_MAX_ITEMS
+            if trimmed:
+                newest = set(self.capture_index.search(**(gallery_filter or {}))[-GALLERY_MAX_ITEMS:])
+                matches = [match for match in matches if match[1] in newest]
+            counts = {}
+            for person, _ in matches:
+                counts[person] = counts.get(person, 0) + 1
+            files = []
+            current = object()
+            for person, image_path in matches:
+                if person != current:
+                    files.append(("header", person, counts[person]))
+                    current = person
+                files.append(image_path)
+        else:
+            files = self.capture_index.search(**(gallery_filter or {}))
+            trimmed = len(files) > GALLERY_MAX_ITEMS
+            files = files[-GALLERY_MAX_ITEMS:]
+        
+        # Drop the current items, including batches of an earlier listing still being added
+        self.gallery_generation += 1
+        for entry in self.captured_images:
+            if entry["frame"] is not None:
+                entry["frame"].destroy()
+        for header in self.gallery_headers:
+            header.destroy()
+        self.captured_images = []
+        self.gallery_headers = []
+        self.gallery_labels.clear()
+        self.gallery_trimmed = trimmed
+        self.canvas.yview_moveto(0)
+        
+        self.update_gallery_count()
+        self.update_selection_count()
+        self.add_gallery_batch(files, 0, self.gallery_generation)
+    
+    def run_retention(self):
+        """Apply the retention policy periodically and after every capture"""
+        while self.is_capturing:
+            removed = self.retention.prune()
+            if removed:
+                print(f"Retention policy removed {len(removed)} files")
+                if self.headless:
+                    self.remove_from_gallery(removed)
+                else:
+                    self.window.after(0, lambda paths=removed: self.remove_from_gallery(paths))
+            last_pass = time.monotonic()
+            self.retention_wakeup.wait(RETENTION_CHECK_INTERVAL)
+            self.retention_wakeup.clear()
+            # A burst of captures is handled by one pass
+            while self.is_capturing:
+                remaining = last_pass + RETENTION_MIN_INTERVAL - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.retention_wakeup.wait(remaining)
+                self.retention_wakeup.clear()
+    
+    def memory_report(self):
+        """Current usage of every memory and disk budget"""
+        queues = [sink.queue for sink in self.notifier.sinks]
+        if self.clip_recorder:
+            queues += [self.clip_recorder.frames_in, self.clip_recorder.clip_jobs]
+        if self.identity_clusterer:
+            queues.append(self.identity_clusterer.jobs)
+        return {
+            "thumbnails": len(self.thumbnail_cache.items),
+            "thumbnail_limit": self.thumbnail_cache.max_items,
+            "thumbnail_bytes": self.thumbnail_cache.resident_bytes,
+            "gallery_items": len(self.captured_images),
+            "queued": sum(q.qsize() for q in queues),
+            "queue_capacity": sum(q.maxsize for q in queues),
+            "queue_dropped": sum(q.dropped for q in queues),
+            "attachment_cache": len(self.attachment_encoder.cache),
+            "clip_buffer_bytes": self.clip_recorder.buffered_bytes if self.clip_recorder else 0,
+            "frame_buffer_bytes": self.frame_buffers.resident_bytes,
+            "frame_buffer_allocations": self.frame_buffers.allocations,
+            "frame_copies": self.frame_buffers.copies,
+            "disk_bytes": self.retention.total_bytes,
+            "disk_limit_mb": self.retention.max_total_mb,
+            "captures_on_disk": self.retention.capture_count,
+        }
+    
+    def update_memory_report(self):
+        """Show memory and disk usage in the gallery header"""
+        if not self.is_capturing:
+            return
+        # Schedule the next update first so an error here doesn't stop the report
+        self.window.after(5000, self.update_memory_report)
+        report = self.memory_report()
+        disk_limit = f"{report['disk_limit_mb']} MB" if report["disk_limit_mb"] else "no limit"
+        self.memory_label.config(
+            text=f"Thumbnails {report['thumbnails']}/{report['thumbnail_limit']} "
+                 f"({report['thumbnail_bytes'] / 1048576:.1f} MB) | "
+                 f"Queued {report['queued']}/{report['queue_capacity']} | "
+                 f"Pre-roll {report['clip_buffer_bytes'] / 1048576:.1f} MB | "
+                 f"Frame buffers {report['frame_buffer_bytes'] / 1048576:.1f} MB | "
+                 f"Disk {report['disk_bytes'] / 1048576:.1f} MB / {disk_limit}"
+        )
+    
+    def selected_images(self):
+        return [entry["path"] for entry in self.captured_images
+                if entry.get("selected") is not None and entry["selected"].get()]
+    
+    def update_selection_count(self):
+        if hasattr(self, "selection_label"):
+            self.selection_label.config(text=f"{len(self.selected_images())} selected")
+    
+    def select_all_images(self, selected):
+        """Select or deselect every capture currently listed"""
+        for entry in self.captured_images:
+            if entry.get("selected") is not None:
+                entry["selected"].set(selected)
+        self.update_selection_count()
+    
+    def run_bulk_job(self, title, paths, process, finish, cleanup=None):
+        """Run process(path) for every capture on a worker thread with progress and cancellation
+        
+        process(path) may return False to leave a capture out of done. cleanup(cancelled) runs
+        on the worker once the loop ends, finish(done, cancelled) runs on the UI thread
+        afterwards - the UI is refreshed once there, not per item.
+        """
+        if self.bulk_cancel is not None:
+            self.show_notification("Please Wait", "Another operation is still running")
+            return
+        cancel = threading.Event()
+        self.bulk_cancel = cancel
+        
+        self.bulk_status.config(text=f"{title} {len(paths)} captures")
+        self.bulk_progress.config(maximum=max(1, len(paths)), value=0)
+        self.bulk_job_frame.pack(fill=tk.X, pady=(0, 10), after=self.bulk_job_anchor)
+        
+        def work():
+            done = []
+            last_update = 0
+            for count, path in enumerate(paths, 1):
+                if cancel.is_set():
+                    break
+                try:
+                    if process(path) is not False:
+                        done.append(path)
+                except Exception as e:
+                    print(f"Error processing {path}: {e}")
+                
+                # Throttle progress updates to the UI
+                now = time.time()
+                if now - last_update > 0.1:
+                    last_update = now
+                    self.window.after(0, lambda value=count: self.bulk_progress.config(value=value))
+            
+            cancelled = cancel.is_set()
+            if cleanup:
+                try:
+                    cleanup(cancelled)
+                except Exception as e:
+                    print(f"Error finishing {title.lower()}: {e}")
+            self.window.after(0, lambda: self.finish_bulk_job(done, cancelled, finish))
+        
+        self.bulk_thread = threading.Thread(target=work, daemon=True)
+        self.bulk_thread.start()
+    
+    def finish_bulk_job(self, done, cancelled, finish):
+        self.bulk_job_frame.pack_forget()
+        self.bulk_cancel = None
+        finish(done, cancelled)
+    
+    def cancel_bulk_job(self):
+        """Stop the running bulk job after the current item"""
+        if self.bulk_cancel is not None:
+            self.bulk_cancel.set()
+    
+    def delete_selected_images(self):
+        """Delete the selected captures after a single confirmation"""
+        paths = self.selected_images()
+        if not paths:
+            self.show_notification("Nothing Selected", "Select images in the gallery first")
+            return
+        
+        def process(image_path):
+            for path in self.capture_store.capture_files(image_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        def finish(done, cancelled):
+            # One gallery refresh and one index transaction for the whole batch
+            self.remove_from_gallery(done)
+            self.retention_wakeup.set()
+            status = "stopped after deleting" if cancelled else "deleted"
+            self.show_notification("Images Deleted", f"{len(done)} of {len(paths)} images {status}")
+        
+        self.ask_confirmation("Confirm Delete", f"Are you sure you want to delete {len(paths)} images?",
+                              "Delete", lambda: self.run_bulk_job("Deleting", paths, process, finish))
+    
+    def export_selected_images(self):
+        """Write every file of the selected captures to a ZIP or tar archive"""
+        paths = self.selected_images()
+        if not paths:
+            self.show_notification("Nothing Selected", "Select images in the gallery first")
+            return
+        archive_path = filedialog.asksaveasfilename(
+            title="Export Images",
+            defaultextension=".zip",
+            filetypes=[("ZIP archive", "*.zip"), ("tar archive", "*.tar"), ("Compressed tar archive", "*.tar.gz")]
+        )
+        if not archive_path:
+            return
+        
+        try:
+            if archive_path.endswith(".zip"):
+                # JPEGs don't compress further - store them as they are
+                archive = zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED)
+                add_file = lambda path: archive.write(path, os.path.basename(path))
+            else:
+                archive = tarfile.open(archive_path, "w:gz" if archive_path.endswith(".gz") else "w")
+                add_file = lambda path: archive.add(path, os.path.basename(path))
+        except OSError as e:
+            self.show_notification("Export Failed", f"Cannot create {os.path.basename(archive_path)}")
+            print(f"Error creating archive: {e}")
+            return
+        
+        def process(image_path):
+            for path in self.capture_store.capture_files(image_path):
+                if os.path.exists(path):
+                    add_file(path)
+        
+        def cleanup(cancelled):
+            archive.close()
+            if cancelled:
+                os.remove(archive_path)
+        
+        def finish(done, cancelled):
+            if cancelled:
+                self.show_notification("Export Cancelled", "No archive was written")
+            else:
+                self.show_notification("Export Complete", f"{len(done)} images exported to {os.path.basename(archive_path)}")
+        
+        self.run_bulk_job("Exporting", paths, process, finish, cleanup)
+    
+    def email_selected_images(self):
+        """Queue an email for each selected capture"""
+        paths = self.selected_images()
+        if not paths:
+            self.show_notification("Nothing Selected", "Select images in the gallery first")
+            return
+        if not self.email_recipient or not self.email_sender or not self.email_password:
+            self.show_notification("Email Not Configured", "Set the email settings in the config file")
+            return
+        
+        def finish(done, cancelled):
+            self.show_notification("Emails Queued", f"{len(done)} of {len(paths)} images queued for email")
+        
+        # Wait for room in the email queue rather than spilling the rest to the spool
+        self.run_bulk_job("Emailing", paths, lambda path: self.queue_email(path, self.bulk_cancel), finish)
+    
+    def ask_confirmation(self, title, message, action_text, on_confirm):
+        """Modal confirmation dialog that calls on_confirm when accepted"""
+        confirm = tk.Toplevel(self.window)
+        confirm.title(title)
+        confirm.geometry("350x150")
+        confirm.configure(bg=self.light_color)
+        confirm.resizable(False, False)
+        confirm.transient(self.window)
+        confirm.grab_set()
+        
+        # Center the dialog
+        x_pos = self.window.winfo_x() + (self.window.winfo_width() - 350) // 2
+        y_pos = self.window.winfo_y() + (self.window.winfo_height() - 150) // 2
+        confirm.geometry(f"+{x_pos}+{y_pos}")
+        
+        frame_inner = ttk.Frame(confirm, style="Light.TFrame")
+        frame_inner.pack(fill=tk.BOTH, expand=True, padx=2, pady=2)
+        
+        warning_label = ttk.Label(frame_inner, text="⚠️", font=("Segoe UI", 24), style="TLabel")
+        warning_label.pack(pady=(15, 5))
+        
+        message_label = ttk.Label(frame_inner, text=message, font=("Segoe UI", 11), style="TLabel")
+        message_label.pack(pady=5)
+        
+        button_frame = ttk.Frame(frame_inner, style="Light.TFrame")
+        button_frame.pack(pady=10)
+        
+        def accept():
+            confirm.destroy()
+            on_confirm()
+        
+        cancel_btn = ttk.Button(button_frame, text="Cancel", command=confirm.destroy, width=8)
+        cancel_btn.pack(side=tk.LEFT, padx=10)
+        
+        action_btn = ttk.Button(button_frame, text=action_text, command=accept, style="Accent.TButton", width=8)
+        action_btn.pack(side=tk.LEFT, padx=10)
+    
     def delete_image(self, image_path, frame):
         """Delete an image from disk and gallery with confirmation"""
         # Create confirmation dialog
@@ -887,23 +4211,13 @@ class FaceDetectionApp:
         
         # Delete button with accent style
         def confirm_delete():
-            # Remove from disk
-            if os.path.exists(image_path):
-                os.remove(image_path)
-            
-            # Remove from UI
-            frame.destroy()
-            
-            # Remove from list
-            self.captured_images = [img for img in self.captured_images if img["path"] != image_path]
+            # Remove the image, its sidecar and any other files of the capture
+            for path in self.capture_store.capture_files(image_path):
+                if os.path.exists(path):
+                    os.remove(path)
             
-            # Update scrollbar
-            self.canvas.update_idletasks()
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-            
-            # Update gallery count
-            if hasattr(self, 'gallery_count'):
-                self.gallery_count.config(text=f"Captured images: {len(self.captured_images)}")
+            # Remove from UI and list, release the thumbnail
+            self.remove_from_gallery([image_path])
             
             # Show notification
             self.show_notification("Image Deleted", "Image has been successfully deleted")
@@ -922,35 +4236,49 @@ class FaceDetectionApp:
     
     def load_existing_images(self):
         """Load existing images from the save directory with progress indicator"""
-        if not os.path.exists(SAVE_DIRECTORY):
+        # Show loading indicator while the sidecars are read in the background
+        self.loading_label = ttk.Label(
+            self.scrollable_frame,
+            text="Loading images...",
+            font=("Segoe UI", 10, "italic"),
+            style="Gallery.TLabel"
+        )
+        self.loading_label.pack(pady=20)
+        
+        self.gallery_loader_stop = threading.Event()
+        self.gallery_loader = threading.Thread(target=self.scan_gallery, daemon=True)
+        self.gallery_loader.start()
+    
+    def scan_gallery(self):
+        """Sync the index with the save directory off the UI thread, then add the captures in batches"""
+        self.capture_index.sync()
+        if self.identity_clusterer:
+            self.identity_clusterer.check_backlog()
+        if not self.gallery_loader_stop.is_set():
+            self.window.after(0, lambda: self.show_gallery(self.gallery_filter))
+    
+    def add_gallery_batch(self, files, start, generation):
+        """Add one batch of gallery items per event loop pass so the window stays responsive"""
+        if self.gallery_loader_stop.is_set() or generation != self.gallery_generation:
             return
-            
-        files = [f for f in os.listdir(SAVE_DIRECTORY) if f.endswith(('.jpg', '.jpeg', '.png'))]
         
-        if not files:
+        # Add gallery items - thumbnails are decoded once they are visible
+        for item in files[start:start + GALLERY_LOAD_BATCH]:
+            if isinstance(item, tuple):
+                self.add_person_header(*item[1:])
+            else:
+                self.add_image_to_gallery(item, lazy=True)
+        
+        if start + GALLERY_LOAD_BATCH < len(files):
+            self.window.after(1, lambda: self.add_gallery_batch(files, start + GALLERY_LOAD_BATCH, generation))
             return
-            
-        # Show loading indicator for larger galleries
-        if len(files) > 5:
-            loading_label = ttk.Label(
-                self.scrollable_frame,
-                text="Loading images...",
-                font=("Segoe UI", 10, "italic"),
-                style="Gallery.TLabel"
-            )
-            loading_label.pack(pady=20)
-            self.canvas.update_idletasks()
         
-        # Load images
-        for filename in files:
-            image_path = os.path.join(SAVE_DIRECTORY, filename)
-            self.add_image_to_gallery(image_path)
-            
-        # Remove loading indicator if it exists
-        for widget in self.scrollable_frame.winfo_children():
-            if isinstance(widget, ttk.Label) and widget.cget("text") == "Loading images...":
-                widget.destroy()
-                break
+        # Remove loading indicator
+        if self.loading_label.winfo_exists():
+            self.loading_label.destroy()
+        
+        # Decode the thumbnails that are visible right away
+        self.schedule_thumbnail_refresh()
     
     def on_closing(self):
         """Clean up resources when closing with confirmation"""
@@ -996,12 +4324,8 @@ class FaceDetectionApp:
         
         # Function to actually close app
         def do_close():
-            self.is_capturing = False
-            if hasattr(self, 'video_thread') and self.video_thread.is_alive():
-                self.video_thread.join(1.0)
-            if self.cap.isOpened():
-                self.cap.release()
-            self.window.destroy()
+            confirm.destroy()
+            self.shutdown()
         
         # Cancel button
         cancel_btn = ttk.Button(
@@ -1021,8 +4345,242 @@ class FaceDetectionApp:
             width=8
         )
         exit_btn.pack(side=tk.LEFT, padx=10)
+    
+    def shutdown(self):
+        """Drain the pipeline on a background thread and close the window once it is done"""
+        # Joining threads here would block the event loop the workers may still need
+        self.status_label.config(text="Shutting down - finishing pending work...", foreground="#d94c4c")
+        worker = threading.Thread(target=self.lifecycle.shutdown, daemon=True)
+        worker.start()
+        
+        def wait_for_shutdown():
+            if worker.is_alive():
+                self.window.after(100, wait_for_shutdown)
+            else:
+                self.window.destroy()
+        wait_for_shutdown()
+
+# Parameter grids searched by --tune
+TUNER_FACE_GRID = {
+    "scaleFactor": [1.05, 1.1, 1.2, 1.3],
+    "minNeighbors": [3, 4, 5, 6],
+    "minSize": [(20, 20), (30, 30), (40, 40)],
+}
+TUNER_SMILE_GRID = {
+    "scaleFactor": [1.3, 1.5, 1.7],
+    "minNeighbors": [10, 15, 20, 25],
+    "minSize": [(15, 15), (25, 25)],
+}
+
+def expand_grid(grid):
+    """All parameter combinations of a grid as dicts"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def load_tuning_dataset(path):
+    """Load labelled grayscale frames from an image directory or a video clip
+    
+    Images need a labels.csv with filename,faces,smiling columns; a clip needs a
+    CSV with the same name and frame,faces,smiling columns. "smiling" is the
+    number of smiling faces.
+    """
+    samples = []
+    if os.path.isdir(path):
+        with open(os.path.join(path, "labels.csv"), newline="") as f:
+            for row in csv.DictReader(f):
+                image = cv2.imread(os.path.join(path, row["filename"]), cv2.IMREAD_GRAYSCALE)
+                if image is None:
+                    print(f"Warning: skipping unreadable image {row['filename']}")
+                    continue
+                samples.append((image, int(row["faces"]), int(row["smiling"])))
+    else:
+        with open(os.path.splitext(path)[0] + ".csv", newline="") as f:
+            labels = {int(row["frame"]): (int(row["faces"]), int(row["smiling"])) for row in csv.DictReader(f)}
+        video = cv2.VideoCapture(path)
+        index = 0
+        while True:
+            ret, frame = video.read()
+            if not ret:
+                break
+            if index in labels:
+                samples.append((cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),) + labels[index])
+            index += 1
+        video.release()
+    return samples
+
+_tuner_state = {}
+
+def init_tuner_worker(dataset_path):
+    """Load the dataset and cascades once per worker process"""
+    _tuner_state["samples"] = load_tuning_dataset(dataset_path)
+    _tuner_state["face"] = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    _tuner_state["smile"] = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
+
+def evaluate_face_params(face_params):
+    """Score one face parameter set against every smile parameter set
+    
+    Faces are detected once per sample and shared by all smile settings.
+    Returns a list of (face_params, smile_params, accuracy, fps).
+    """
+    samples = _tuner_state["samples"]
+    smile_grid = expand_grid(TUNER_SMILE_GRID)
+    face_time = 0.0
+    smile_time = [0.0] * len(smile_grid)
+    correct = [0.0] * len(smile_grid)
+    
+    for gray, expected_faces, expected_smiling in samples:
+        start = time.perf_counter()
+        faces = _tuner_state["face"].detectMultiScale(gray, **face_params)
+        face_time += time.perf_counter() - start
+        face_ok = len(faces) == expected_faces
+        
+        for index, smile_params in enumerate(smile_grid):
+            start = time.perf_counter()
+            smiling = 0
+            for (x, y, w, h) in faces:
+                if len(_tuner_state["smile"].detectMultiScale(gray[y:y+h, x:x+w], **smile_params)) > 0:
+                    smiling += 1
+            smile_time[index] += time.perf_counter() - start
+            smile_ok = (smiling > 0) == (expected_smiling > 0)
+            correct[index] += (face_ok + smile_ok) / 2.0
+    
+    results = []
+    for index, smile_params in enumerate(smile_grid):
+        total_time = face_time + smile_time[index]
+        results.append((face_params, smile_params, correct[index] / len(samples),
+                        len(samples) / total_time if total_time > 0 else 0.0))
+    return results
+
+def pareto_front(results):
+    """Settings that no other setting beats on both accuracy and throughput"""
+    front = []
+    best_fps = -1.0
+    for result in sorted(results, key=lambda r: (-r[2], -r[3])):
+        if result[3] > best_fps:
+            front.append(result)
+            best_fps = result[3]
+    return front
+
+def run_tuner(args):
+    """Search the cascade parameter grids on a labelled dataset and save the best settings"""
+    samples = load_tuning_dataset(args.tune)
+    if not samples:
+        print("Error: no labelled samples found")
+        return
+    face_grid = expand_grid(TUNER_FACE_GRID)
+    workers = args.tune_workers or multiprocessing.cpu_count()
+    print(f"Tuning on {len(samples)} samples: {len(face_grid) * len(expand_grid(TUNER_SMILE_GRID))} "
+          f"combinations on {workers} processes")
+    del samples
+    
+    with multiprocessing.Pool(workers, initializer=init_tuner_worker, initargs=(args.tune,)) as pool:
+        results = [result for batch in pool.imap_unordered(evaluate_face_params, face_grid) for result in batch]
+    
+    # Report the accuracy-vs-throughput trade-off
+    front = pareto_front(results)
+    print("\nPareto front (accuracy vs. throughput):")
+    print(f"{'accuracy':>9} {'fps':>8}  face / smile parameters")
+    for face_params, smile_params, accuracy, fps in front:
+        print(f"{accuracy:9.3f} {fps:8.1f}  {face_params} / {smile_params}")
+    
+    # Most accurate setting that is still fast enough, otherwise the fastest
+    fast_enough = [result for result in front if result[3] >= args.tune_min_fps]
+    chosen = fast_enough[0] if fast_enough else front[-1]
+    face_params, smile_params, accuracy, fps = chosen
+    # Merge into the detection section of the config file
+    config = {}
+    if os.path.exists(args.tune_output):
+        with open(args.tune_output, encoding="utf-8") as f:
+            config = json.load(f)
+    config["detection"] = {
+        "face": face_params,
+        "smile": smile_params,
+        "tuned": {
+            "dataset": os.path.abspath(args.tune),
+            "accuracy": round(accuracy, 4),
+            "fps": round(fps, 1),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+    }
+    with open(args.tune_output, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(f"\nChosen: accuracy {accuracy:.3f} at {fps:.1f} fps - saved to {args.tune_output}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Smile Detection App")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="play back a recorded clip, image directory or glob instead of the camera")
+    parser.add_argument("--max-speed", action="store_true",
+                        help="replay as fast as possible instead of in real time")
+    parser.add_argument("--loop", action="store_true", help="restart the replay when it ends")
+    parser.add_argument("--headless", action="store_true", help="run the pipeline without a window (needs --replay)")
+    parser.add_argument("--no-email", action="store_true", help="don't send emails for captures")
+    parser.add_argument("--profile", metavar="FILE", help="write cProfile statistics of a headless run to FILE")
+    parser.add_argument("--preview-port", type=int, default=PREVIEW_SERVER_PORT,
+                        help="serve the annotated feed over MJPEG/WebSocket on this port")
+    parser.add_argument("--preview-host", default=PREVIEW_SERVER_HOST,
+                        help="interface the preview server listens on (default: local only; "
+                             "0.0.0.0 shares the unauthenticated feed with the network)")
+    parser.add_argument("--tune", metavar="DATASET",
+                        help="tune cascade parameters on a labelled image directory or clip and exit")
+    parser.add_argument("--tune-min-fps", type=float, default=15.0,
+                        help="slowest acceptable throughput when choosing tuned settings")
+    parser.add_argument("--tune-workers", type=int, default=0, help="processes used by --tune (default: all cores)")
+    parser.add_argument("--tune-output", default=CONFIG_FILE, help="JSON config file --tune writes its settings to")
+    parser.add_argument("--config", default=CONFIG_FILE, help="JSON or TOML settings file, reloaded when it changes")
+    return parser.parse_args()
+
+def run_headless(args):
+    """Run the whole pipeline on a replay source without a window"""
+    if not args.replay:
+        print("Error: --headless needs a --replay source")
+        return
+    
+    capture = ReplayCapture(args.replay, realtime=not args.max_speed, loop=args.loop)
+    app = FaceDetectionApp(None, "Smile Detection App", capture=capture, preview_port=args.preview_port,
+                           settings=load_settings(args), preview_host=args.preview_host)
+    if not app.is_capturing:
+        return
+    
+    profiler = cProfile.Profile() if args.profile else None
+    start_time = time.time()
+    if profiler:
+        profiler.enable()
+    try:
+        app.update()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    elapsed = time.time() - start_time
+    
+    # Summary of the run
+    print(f"Processed {app.frames_processed} frames in {elapsed:.2f}s "
+          f"({app.frames_processed / max(elapsed, 1e-6):.1f} fps)")
+    print(f"Motion gate skipped {app.motion_gate.skipped_percent:.0f}% of frames")
+    print(f"Frame buffers: {app.frame_buffers.allocations} allocations, {app.frame_buffers.copies} copies")
+    print(f"Captured {app.captures_taken} images")
+    app.lifecycle.shutdown()
+
+def load_settings(args):
+    """Load the config file with command line overrides applied on top"""
+    overrides = {}
+    if args.no_email:
+        overrides["email"] = {"auto_email": False}
+    return AppConfig(args.config, overrides)
 
 def main():
+    args = parse_args()
+    if args.tune:
+        run_tuner(args)
+        return
+    
+    if args.headless:
+        run_headless(args)
+        return
+    
     # Create tkinter window with app icon
     root = tk.Tk()
     root.title("Smile Detection App")
@@ -1052,8 +4610,12 @@ def main():
         # Skip icon if there's an error
         pass
     
-    # Run the app
-    app = FaceDetectionApp(root, "Smile Detection App")
+    # Run the app, on a recorded session if one was given
+    capture = None
+    if args.replay:
+        capture = ReplayCapture(args.replay, realtime=not args.max_speed, loop=args.loop)
+    app = FaceDetectionApp(root, "Smile Detection App", capture=capture, preview_port=args.preview_port,
+                           settings=load_settings(args), preview_host=args.preview_host)
     
     # Center window on screen
     root.update_idletasks()